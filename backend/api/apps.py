@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import ingredient_index  # noqa: F401 - сигналы индекса
+        from . import recipe_match_index  # noqa: F401
@@ -0,0 +1,134 @@
+'''
+Валидаторы условных запросов (ETag / Last-Modified): по ним
+django.views.decorators.http.condition отвечает 304 Not Modified
+до выполнения запросов данных и сериализации.
+'''
+from django.db.models import BooleanField, Exists, OuterRef, Subquery, Value
+from django.views.decorators.http import condition
+
+from .ingredient_index import ingredient_index
+from recipes.models import (
+    FavoriteRecipes, Ingredient, ModelVersion,
+    Recipe, ShoppingList,
+    Subscriptions, Tag, User
+)
+
+
+def per_request(func):
+    '''Вычисляет валидатор один раз на запрос (для ETag и Last-Modified).'''
+    attribute = f'_{func.__name__}'
+
+    def wrapper(request, *args, **kwargs):
+        if not hasattr(request, attribute):
+            setattr(request, attribute, func(request, *args, **kwargs))
+        return getattr(request, attribute)
+    return wrapper
+
+
+def model_version_etag(version):
+    return (
+        f'"{version.label}-{version.version}-'
+        f'{version.updated_at.timestamp()}"'
+    )
+
+
+def model_version_condition(get_version):
+    return condition(
+        etag_func=lambda request, *args, **kwargs: model_version_etag(
+            get_version(request)
+        ),
+        last_modified_func=lambda request, *args, **kwargs: (
+            get_version(request).updated_at
+        ),
+    )
+
+
+@per_request
+def tag_version(request):
+    return ModelVersion.current(Tag)
+
+
+@per_request
+def ingredient_version(request):
+    return ingredient_index.version()
+
+
+# Справочники, данные которых входят в ответ с рецептом: автор, теги
+# и продукты. Их версии входят в валидаторы рецепта.
+RECIPE_RELATED_MODELS = (User, Tag, Ingredient)
+
+
+@per_request
+def recipe_state(request, pk=None):
+    '''
+    Всё, от чего зависит ответ с рецептом, одним запросом: дата
+    изменения рецепта, флаги текущего пользователя и версии
+    RECIPE_RELATED_MODELS (имя и аватар автора, названия тегов и
+    продуктов).
+    '''
+    user = request.user
+    versions = {}
+    for model in RECIPE_RELATED_MODELS:
+        version = ModelVersion.objects.filter(label=model._meta.label_lower)
+        name = model._meta.model_name
+        versions[f'{name}_version'] = Subquery(version.values('version'))
+        versions[f'{name}_updated_at'] = Subquery(
+            version.values('updated_at')
+        )
+    if user.is_authenticated:
+        flags = {
+            'is_favorited': Exists(FavoriteRecipes.objects.filter(
+                author=user, recipe=OuterRef('pk')
+            )),
+            'is_in_shopping_cart': Exists(ShoppingList.objects.filter(
+                author=user, recipe=OuterRef('pk')
+            )),
+            'is_subscribed': Exists(Subscriptions.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        }
+    else:
+        flags = {
+            name: Value(False, output_field=BooleanField())
+            for name in ('is_favorited', 'is_in_shopping_cart',
+                         'is_subscribed')
+        }
+    return Recipe.objects.filter(pk=pk).annotate(
+        **versions, **flags
+    ).values('id', 'updated_at', *versions, *flags).first()
+
+
+def recipe_etag(request, pk=None):
+    state = recipe_state(request, pk)
+    if state is None:
+        return None
+    versions = '-'.join(
+        str(state[f'{model._meta.model_name}_version'] or 0)
+        for model in RECIPE_RELATED_MODELS
+    )
+    return (
+        f'"recipe-{state["id"]}-{state["updated_at"].timestamp()}-'
+        f'{state["is_favorited"]:d}{state["is_in_shopping_cart"]:d}'
+        f'{state["is_subscribed"]:d}-{versions}"'
+    )
+
+
+def recipe_last_modified(request, pk=None):
+    '''
+    Только для анонимов: флаги пользователя меняются без изменения
+    рецепта, поэтому для них годится лишь ETag.
+    '''
+    state = recipe_state(request, pk)
+    if state is None or request.user.is_authenticated:
+        return None
+    return max(filter(None, (state['updated_at'], *(
+        state[f'{model._meta.model_name}_updated_at']
+        for model in RECIPE_RELATED_MODELS
+    ))))
+
+
+tag_condition = model_version_condition(tag_version)
+ingredient_condition = model_version_condition(ingredient_version)
+recipe_condition = condition(
+    etag_func=recipe_etag, last_modified_func=recipe_last_modified
+)
@@ -0,0 +1,136 @@
+import binascii
+import hashlib
+import io
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+from recipes.images import variant_names, variant_storage
+
+
+class StreamingBase64ImageField(serializers.FileField):
+    '''
+    Изображение в base64 (data URL или просто строка).
+    Строка декодируется кусками в SpooledTemporaryFile, попутно
+    считается SHA-256 для имени файла. Формат и размеры читаются из
+    заголовка первых кусков, так что слишком большие изображения
+    отклоняются до полного декодирования.
+    '''
+    FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+    # Кратно 4 символам base64, чтобы куски декодировались независимо.
+    CHUNK_SIZE = 256 * 1024
+    SNIFF_SIZE = 256 * 1024
+    default_error_messages = {
+        'invalid_image': (
+            'Загрузите изображение JPEG, PNG, GIF или WebP в base64.'
+        ),
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid_image')
+        start = data.find(';base64,')
+        start = 0 if start == -1 else start + len(';base64,')
+        max_size = settings.IMAGE_MAX_UPLOAD_SIZE
+        # Оценка по длине строки - отказ ещё до декодирования.
+        if (len(data) - start) // 4 * 3 > max_size + 2:
+            self.fail('too_large', max_size=max_size)
+        file = SpooledTemporaryFile(max_size=settings.IMAGE_SPOOL_MAX_SIZE)
+        digest = hashlib.sha256()
+        head = b''
+        carry = ''
+        try:
+            for position in range(start, len(data), self.CHUNK_SIZE):
+                chunk = carry + ''.join(
+                    data[position:position + self.CHUNK_SIZE].split()
+                )
+                if position + self.CHUNK_SIZE < len(data):
+                    usable = len(chunk) - len(chunk) % 4
+                    chunk, carry = chunk[:usable], chunk[usable:]
+                decoded = binascii.a2b_base64(chunk)
+                digest.update(decoded)
+                file.write(decoded)
+                if file.tell() > max_size:
+                    self.fail('too_large', max_size=max_size)
+                if head is not None and len(head) < self.SNIFF_SIZE:
+                    head += decoded[:self.SNIFF_SIZE - len(head)]
+                    if self.sniff(io.BytesIO(head), strict=False):
+                        head = None
+            size = file.tell()
+            if not size:
+                self.fail('invalid_image')
+            file.seek(0)
+            image_format = self.sniff(file, strict=True)
+            file.seek(0)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_image')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        upload = UploadedFile(
+            file=file,
+            name=f'{digest.hexdigest()}.{self.FORMATS[image_format]}',
+            content_type=Image.MIME[image_format],
+            size=size,
+        )
+        # ContentAddressedStorage берёт готовый хэш, не читая файл заново.
+        upload.sha256 = digest.hexdigest()
+        return super().to_internal_value(upload)
+
+    def sniff(self, file, strict):
+        '''
+        Читает только заголовок изображения: проверяет формат и число
+        пикселей. При strict=False недочитанный заголовок не ошибка.
+        При strict=True дополнительно проверяет целостность (verify).
+        '''
+        max_pixels = settings.IMAGE_MAX_PIXELS
+        try:
+            image = Image.open(file, formats=tuple(self.FORMATS))
+        except Image.DecompressionBombError:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        except Exception:
+            if strict:
+                self.fail('invalid_image')
+            return None
+        if image.width * image.height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        if strict:
+            try:
+                image.verify()
+            except Exception:
+                self.fail('invalid_image')
+        return image.format
+
+    def validate_empty_values(self, data):
+        if data == '':
+            data = None
+        return super().validate_empty_values(data)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    '''
+    Ссылки на уменьшенные копии изображения:
+    {thumbnail|card|full: {webp, jpeg}}. Копии строятся в фоне,
+    поэтому сразу после загрузки клиенту стоит откатываться к image.
+    '''
+
+    def to_representation(self, image):
+        if not image:
+            return None
+        request = self.context.get('request')
+        return {
+            variant: {
+                image_format: (
+                    request.build_absolute_uri(variant_storage.url(path))
+                    if request else variant_storage.url(path)
+                )
+                for image_format, path in paths.items()
+            }
+            for variant, paths in variant_names(image.name).items()
+        }
@@ -0,0 +1,90 @@
+'''
+Разреженные наборы полей ответа: ?fields=a,b оставляет только
+перечисленные поля, а связи среди них (автор, теги, продукты, рецепты
+подписки) отдаются идентификаторами, если не перечислены в ?expand=.
+Без ?fields= ответ полный. Queryset читает только то, что нужно
+запрошенным полям.
+'''
+from functools import cached_property
+
+from rest_framework.exceptions import ValidationError
+
+
+def parse_names(value):
+    return frozenset(name.strip() for name in value.split(',') if name.strip())
+
+
+def requested_fieldset(request, serializer_class):
+    '''(fields, expand) из запроса; fields=None - все поля.'''
+    if 'fields' not in request.query_params:
+        return None, frozenset()
+    fields = parse_names(request.query_params['fields'])
+    expand = parse_names(request.query_params.get('expand', ''))
+    available = serializer_class.Meta.fields
+    if not fields or fields - set(available):
+        raise ValidationError({
+            'fields': f'Доступные поля: {", ".join(available)}.'
+        })
+    if expand - set(serializer_class.collapsed_fields):
+        raise ValidationError({
+            'expand': 'Можно развернуть: '
+                      f'{", ".join(serializer_class.collapsed_fields)}.'
+        })
+    return fields, expand
+
+
+class SparseFieldsMixin:
+    '''
+    Сериализатор с разреженным набором полей: принимает fields и
+    expand из requested_fieldset. collapsed_fields - фабрики полей,
+    которыми связи заменяются без expand; field_columns - столбцы
+    модели, которые читает каждое поле (кроме id).
+    '''
+    collapsed_fields = {}
+    field_columns = {}
+
+    def __init__(self, *args, fields=None, expand=frozenset(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = fields is not None
+        if not self.sparse:
+            return
+        for name in set(self.fields) - fields:
+            del self.fields[name]
+        for name, field in self.collapsed_fields.items():
+            if name in self.fields and name not in expand:
+                self.fields[name] = field()
+
+    @classmethod
+    def columns(cls, fields):
+        '''Столбцы модели для only() под набор полей.'''
+        return {'id'} | {
+            column for name in fields
+            for column in cls.field_columns.get(name, ())
+        }
+
+
+class SparseFieldsViewMixin:
+    '''
+    ?fields= и ?expand= для GET-запросов действий из sparse_actions
+    (действие -> класс сериализатора): набор полей разбирается один
+    раз и передаётся сериализатору из get_serializer.
+    '''
+    sparse_actions = {}
+
+    @cached_property
+    def fieldset(self):
+        if (self.action not in self.sparse_actions
+                or self.request.method != 'GET'):
+            return None, frozenset()
+        return requested_fieldset(
+            self.request, self.sparse_actions[self.action]
+        )
+
+    def sparse_kwargs(self):
+        fields, expand = self.fieldset
+        return {} if fields is None else {'fields': fields, 'expand': expand}
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(
+            *args, **kwargs, **self.sparse_kwargs()
+        )
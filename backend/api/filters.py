@@ -1,16 +1,10 @@
 import django_filters
-from django_filters.rest_framework import CharFilter, FilterSet
+from django_filters.rest_framework import CharFilter
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Recipe, Tag
 from recipes.models import User
-
-
-class IngredientFilter(FilterSet):
-    name = CharFilter(lookup_expr='startswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+from recipes.search import search_recipes
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -28,6 +22,12 @@ class RecipeFilter(django_filters.FilterSet):
     is_favorited = django_filters.NumberFilter(
         method='filter_is_favorited'
     )
+    # Объявлен до ordering: явная сортировка важнее релевантности.
+    search = CharFilter(method='filter_search')
+    ordering = django_filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
@@ -46,3 +46,19 @@ class RecipeFilter(django_filters.FilterSet):
                 favoriterecipes__author=self.request.user
             )
         return recipes
+
+    def check_pagination(self, name):
+        # Курсор пагинации построен на порядке по дате создания.
+        if self.request.GET.get('pagination') == 'cursor':
+            raise ValidationError({
+                name: 'Не поддерживается с pagination=cursor.'
+            })
+
+    def filter_search(self, recipes, name, value):
+        self.check_pagination(name)
+        return search_recipes(recipes, value)
+
+    def filter_ordering(self, recipes, name, value):
+        self.check_pagination(name)
+        # Порядок совпадает с индексом recipe_popular_idx.
+        return recipes.order_by('-favorites_count', '-created_at', '-id')
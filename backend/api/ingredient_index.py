@@ -0,0 +1,83 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, ModelVersion
+
+
+def normalize(text):
+    '''Ключ поиска без учёта регистра; "ё" и "е" не различаются.'''
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientPrefixIndex:
+    '''
+    Неизменяемый индекс продуктов в памяти процесса: отсортированный
+    массив нормализованных названий, поиск по префиксу через bisect.
+    Строится при первом обращении, сбрасывается сигналами Ingredient;
+    изменения из других процессов подхватываются не позже чем через
+    INGREDIENT_INDEX_TTL секунд.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and (
+            time.monotonic() - snapshot[0] < settings.INGREDIENT_INDEX_TTL
+        ):
+            return snapshot
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._snapshot = self._build()
+            return self._snapshot
+
+    @staticmethod
+    def _build():
+        # Версия читается до данных: снимок не может оказаться старше неё.
+        version = ModelVersion.current(Ingredient)
+        rows = sorted(
+            (
+                (normalize(ingredient['name']), ingredient['id'], ingredient)
+                for ingredient in Ingredient.objects.values(
+                    'id', 'name', 'measurement_unit'
+                )
+            ),
+            key=lambda row: row[:2]
+        )
+        return (
+            time.monotonic(),
+            version,
+            [key for key, _, _ in rows],
+            [ingredient for _, _, ingredient in rows],
+        )
+
+    def version(self):
+        '''Версия Ingredient (ModelVersion), по которой построен индекс.'''
+        return self._get_snapshot()[1]
+
+    def search(self, prefix='', limit=None):
+        _, _, keys, ingredients = self._get_snapshot()
+        prefix = normalize(prefix)
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + chr(0x10FFFF), lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return ingredients[start:end]
+
+
+ingredient_index = IngredientPrefixIndex()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
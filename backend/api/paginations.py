@@ -1,6 +1,78 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ApiPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class NoCountPagination(ApiPagination):
+    '''
+    Постраничная пагинация без COUNT(*): наличие следующей страницы
+    определяется выборкой одной лишней записи. Ответ без поля count.
+    '''
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1)
+            )
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='Номер страницы должен быть целым положительным.'
+            ))
+        offset = (self.page_number - 1) * self.page_size
+        page = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        return page[:self.page_size]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param, self.page_number + 1
+        )
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1
+        )
+
+
+class RecipeCursorPagination(CursorPagination):
+    '''
+    Курсорная (keyset) пагинация ленты по (created_at, id): без COUNT(*)
+    и OFFSET, время выдачи не зависит от глубины страницы.
+    '''
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'limit'
+    page_size = 6
+
+
+# Значение ?pagination= -> класс пагинации; по умолчанию - ApiPagination.
+PAGINATION_MODES = {
+    'page': ApiPagination,
+    'nocount': NoCountPagination,
+    'cursor': RecipeCursorPagination,
+}
@@ -0,0 +1,175 @@
+import threading
+import time
+from array import array
+from collections import Counter, namedtuple
+from datetime import timedelta
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import ModelVersion, Recipe, RecipeIngredient
+
+# Тип элементов массивов: беззнаковое 32-битное целое.
+RECIPE_ID_TYPE = 'I'
+
+Snapshot = namedtuple(
+    'Snapshot', ('built_at', 'version', 'synced_at', 'postings', 'overlay')
+)
+
+
+def group_ingredients(rows):
+    '''(recipe_id, ingredient_id), упорядоченные по рецепту -> пары
+    (recipe_id, frozenset продуктов).'''
+    for recipe_id, group in groupby(rows, key=itemgetter(0)):
+        yield recipe_id, frozenset(map(itemgetter(1), group))
+
+
+def build_postings(recipes):
+    '''
+    (recipe_id, продукты) по возрастанию id -> {продукт: {число
+    продуктов в рецепте: отсортированный array id рецептов}}.
+    '''
+    postings = {}
+    for recipe_id, ingredient_ids in recipes:
+        size = len(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            by_size = postings.setdefault(ingredient_id, {})
+            if size not in by_size:
+                by_size[size] = array(RECIPE_ID_TYPE)
+            by_size[size].append(recipe_id)
+    return postings
+
+
+def match_postings(postings, overlay, ingredient_ids, max_missing=0):
+    '''
+    Рецепты, которым из ingredient_ids не хватает не больше
+    max_missing продуктов: список (id, найдено, не хватает) по
+    возрастанию недостающих, затем по убыванию найденных и id.
+    '''
+    ingredient_ids = frozenset(ingredient_ids)
+    matches = []
+    # Рецепту из size продуктов нужно найти хотя бы size - max_missing
+    # из ingredient_ids, поэтому рецепты крупнее не просматриваются.
+    for size in range(1, len(ingredient_ids) + max_missing + 1):
+        counts = Counter()
+        for ingredient_id in ingredient_ids:
+            counts.update(postings.get(ingredient_id, {}).get(size, ()))
+        required = size - max_missing
+        matches.extend(
+            (recipe_id, found, size - found)
+            for recipe_id, found in counts.items()
+            if found >= required and recipe_id not in overlay
+        )
+    for recipe_id, recipe_ingredients in overlay.items():
+        if recipe_ingredients is None:
+            continue
+        found = len(recipe_ingredients & ingredient_ids)
+        missing = len(recipe_ingredients) - found
+        if found and missing <= max_missing:
+            matches.append((recipe_id, found, missing))
+    matches.sort(key=lambda match: (match[2], -match[1], -match[0]))
+    return matches
+
+
+class RecipeMatchIndex:
+    '''
+    Инвертированный индекс рецептов по продуктам в памяти процесса для
+    подбора «что приготовить»: продукт -> число продуктов в рецепте ->
+    отсортированный массив id рецептов (array).
+
+    Основа строится целиком при первом обращении и раз в
+    RECIPE_MATCH_INDEX_TTL секунд. Изменения после построения хранятся
+    в небольшом словаре overlay (рецепт -> его продукты, None - рецепт
+    удалён): запись через API попадает туда сразу после коммита,
+    изменения из других процессов подхватываются по версии Recipe
+    (ModelVersion) и полю updated_at. Рецепты, удалённые другими
+    процессами, отсеиваются при загрузке страницы из БД.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or (
+            time.monotonic() - snapshot.built_at
+            >= settings.RECIPE_MATCH_INDEX_TTL
+        ) or len(snapshot.overlay) > settings.RECIPE_MATCH_OVERLAY_LIMIT:
+            with self._lock:
+                if self._snapshot is snapshot:
+                    self._snapshot = self._build()
+                return self._snapshot
+        version = ModelVersion.current(Recipe).version
+        if version == snapshot.version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._snapshot = self._sync(snapshot, version)
+            return self._snapshot
+
+    @staticmethod
+    def _build():
+        # Версия и время читаются до данных: снимок не старше них.
+        version = ModelVersion.current(Recipe).version
+        synced_at = timezone.now()
+        rows = RecipeIngredient.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator(chunk_size=settings.RECIPE_MATCH_BUILD_CHUNK_SIZE)
+        postings = build_postings(group_ingredients(rows))
+        return Snapshot(time.monotonic(), version, synced_at, postings, {})
+
+    @staticmethod
+    def _sync(snapshot, version):
+        '''Переносит в overlay рецепты, изменённые с прошлой сверки.'''
+        synced_at = timezone.now()
+        rows = RecipeIngredient.objects.filter(
+            recipe__updated_at__gte=snapshot.synced_at - timedelta(
+                seconds=settings.RECIPE_MATCH_SYNC_MARGIN
+            )
+        ).order_by('recipe_id').values_list('recipe_id', 'ingredient_id')
+        overlay = dict(snapshot.overlay)
+        overlay.update(group_ingredients(rows))
+        return snapshot._replace(
+            version=version, synced_at=synced_at, overlay=overlay
+        )
+
+    def update(self, recipes):
+        '''recipes: {recipe_id: id продуктов или None для удалённого}.'''
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            overlay = dict(snapshot.overlay)
+            overlay.update(
+                (recipe_id, None if ingredient_ids is None
+                 else frozenset(ingredient_ids))
+                for recipe_id, ingredient_ids in recipes.items()
+            )
+            self._snapshot = snapshot._replace(overlay=overlay)
+
+    def update_on_commit(self, recipes):
+        transaction.on_commit(partial(self.update, recipes))
+
+    def match(self, ingredient_ids, max_missing=0):
+        snapshot = self._get_snapshot()
+        return match_postings(
+            snapshot.postings, snapshot.overlay, ingredient_ids, max_missing
+        )
+
+
+recipe_match_index = RecipeMatchIndex()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_deleted_recipe(sender, instance, **kwargs):
+    recipe_match_index.update_on_commit({instance.pk: None})
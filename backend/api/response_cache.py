@@ -0,0 +1,95 @@
+'''
+Кэш ответов ленты и рецептов для анонимов: для них флаги
+is_favorited, is_in_shopping_cart и is_subscribed всегда ложны,
+и JSON одинаков для всех. Ключ - нормализованный URL запроса
+и версии Recipe, User, Tag и Ingredient (ModelVersion), поэтому
+запись в любую из моделей делает старые ключи недостижимыми.
+Порядок по популярности зависит от счётчиков избранного, которые
+меняются без смены версий, поэтому такие запросы не кэшируются.
+'''
+import functools
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from recipes.models import Ingredient, ModelVersion, Recipe, Tag, User
+
+
+logger = logging.getLogger(__name__)
+
+VERSIONED_MODELS = (Recipe, User, Tag, Ingredient)
+HITS_KEY = 'response_cache:hits'
+MISSES_KEY = 'response_cache:misses'
+# Параметры запроса, с которыми ответ не кэшируется.
+UNCACHED_PARAMS = ('ordering',)
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def versions():
+    labels = [model._meta.label_lower for model in VERSIONED_MODELS]
+    current = dict(ModelVersion.objects.filter(
+        label__in=labels
+    ).values_list('label', 'version'))
+    return '-'.join(str(current.get(label, 0)) for label in labels)
+
+
+def cache_key(request, view):
+    query = '&'.join(
+        f'{name}={value}'
+        for name in sorted(request.query_params)
+        for value in sorted(request.query_params.getlist(name))
+    )
+    url = (
+        f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+        f'|{request.accepted_media_type}'
+    )
+    return (
+        f'response_cache:{view.basename}:{view.action}:{versions()}:'
+        + hashlib.sha256(url.encode()).hexdigest()
+    )
+
+
+def count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def stats():
+    cache = get_cache()
+    return cache.get(HITS_KEY, 0), cache.get(MISSES_KEY, 0)
+
+
+def anonymous_response_cache(view_method):
+    '''Кэширует успешные ответы действия viewset для анонимов.'''
+    @functools.wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        if request.user.is_authenticated or any(
+            name in request.query_params for name in UNCACHED_PARAMS
+        ):
+            return view_method(view, request, *args, **kwargs)
+        key = cache_key(request, view)
+        data = get_cache().get(key)
+        if data is not None:
+            count(HITS_KEY)
+            logger.debug('Попадание в кэш ответов: %s', key)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        count(MISSES_KEY)
+        response = view_method(view, request, *args, **kwargs)
+        if response.status_code == 200:
+            get_cache().set(
+                key, response.data, settings.RESPONSE_CACHE_TIMEOUT
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
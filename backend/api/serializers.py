@@ -1,31 +1,54 @@
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import (
     UserSerializer
 )
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from .fields import StreamingBase64ImageField, ImageVariantsField
+from .fieldsets import SparseFieldsMixin
+from .recipe_match_index import recipe_match_index
 from recipes.models import (
-    FavoriteRecipes, Ingredient,
+    FavoriteRecipes, FeedEntry, Ingredient, ModelVersion,
     RecipeIngredient, Recipe,
-    ShoppingList, Subscriptions,
-    Tag, User
+    ShoppingList, ShoppingListTotal,
+    Subscriptions, Tag, User
 )
+from recipes.search import update_search_index
 
 
 MIN_AMOUNT = 1
 
 
 # --------------- Сериалайзер для User ---------------
-class FoodgramUserSerializer(UserSerializer):
-    avatar = Base64ImageField(required=False, allow_null=True)
+class FoodgramUserSerializer(SparseFieldsMixin, UserSerializer):
+    avatar = StreamingBase64ImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField(source='avatar')
     is_subscribed = serializers.SerializerMethodField()
 
+    field_columns = {
+        'email': ('email',),
+        'username': ('username',),
+        'first_name': ('first_name',),
+        'last_name': ('last_name',),
+        'avatar': ('avatar',),
+        'avatar_variants': ('avatar',),
+    }
+
     class Meta:
         model = User
-        fields = (*UserSerializer.Meta.fields, 'avatar', 'is_subscribed')
+        fields = (*UserSerializer.Meta.fields, 'avatar', 'avatar_variants',
+                  'is_subscribed')
 
     def get_is_subscribed(self, user):
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
         request = self.context.get('request')
         return (
             request is not None and not request.user.is_anonymous
@@ -61,9 +84,24 @@ class IngredientInRecipeReadSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, recipes):
+        if not isinstance(recipes, list):
+            recipes = list(recipes.all())
+        return self.child.represent_many(recipes)
+
+
+class RecipeReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     '''
-    Serializer для модели Recipe - чтение данных
+    Serializer для модели Recipe - чтение данных.
+
+    Не зависящая от пользователя часть ответа (фрагмент) кэшируется
+    по ключу (рецепт, updated_at, профиль автора, версии Tag и
+    Ingredient); поверх неё для каждого запроса проставляются флаги
+    is_favorited, is_in_shopping_cart и author.is_subscribed.
+    Продукты и теги загружаются только для рецептов без фрагмента.
+    Разреженный ответ (?fields=) собирается мимо кэша из того, что
+    загрузил sparse_recipe_queryset.
     '''
     author = FoodgramUserSerializer()
     ingredients = IngredientInRecipeReadSerializer(
@@ -75,22 +113,134 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     tags = TagSerializer(many=True)
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    collapsed_fields = {
+        'author': partial(
+            serializers.PrimaryKeyRelatedField, read_only=True
+        ),
+        'tags': partial(
+            serializers.PrimaryKeyRelatedField, many=True, read_only=True
+        ),
+        'ingredients': partial(
+            serializers.SlugRelatedField, many=True, read_only=True,
+            source='recipe_ingredients', slug_field='ingredient_id'
+        ),
+    }
+    field_columns = {
+        'author': ('author',),
+        'name': ('name',),
+        'image': ('image',),
+        'image_variants': ('image',),
+        'text': ('text',),
+        'cooking_time': ('cooking_time',),
+    }
+
+    def to_representation(self, recipe):
+        return self.represent_many([recipe])[0]
+
+    def represent_many(self, recipes):
+        for recipe in recipes:
+            if hasattr(recipe, 'author_is_subscribed'):
+                recipe.author.is_subscribed = recipe.author_is_subscribed
+        if self.sparse:
+            return [super(RecipeReadSerializer, self).to_representation(
+                recipe
+            ) for recipe in recipes]
+        cache = caches[settings.RECIPE_FRAGMENT_CACHE_ALIAS]
+        prefix = self.fragment_key_prefix()
+        keys = {recipe.id: self.fragment_key(prefix, recipe)
+                for recipe in recipes}
+        fragments = cache.get_many(keys.values())
+        missing = [recipe for recipe in recipes
+                   if keys[recipe.id] not in fragments]
+        if missing:
+            prefetch_related_objects(
+                missing, 'tags', Prefetch(
+                    'recipe_ingredients',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient'
+                    )
+                )
+            )
+            created = {
+                keys[recipe.id]: super(
+                    RecipeReadSerializer, self
+                ).to_representation(recipe)
+                for recipe in missing
+            }
+            cache.set_many(created, settings.RECIPE_FRAGMENT_TIMEOUT)
+            fragments.update(created)
+        return [self.overlay(fragments[keys[recipe.id]], recipe)
+                for recipe in recipes]
+
+    def fragment_key_prefix(self):
+        request = self.context.get('request')
+        versions = dict(ModelVersion.objects.filter(
+            label__in=('recipes.tag', 'recipes.ingredient')
+        ).values_list('label', 'version'))
+        return (
+            'recipe_fragment:'
+            f'{request.build_absolute_uri("/") if request else ""}:'
+            f'{versions.get("recipes.tag", 0)}-'
+            f'{versions.get("recipes.ingredient", 0)}'
+        )
 
-    def check_user_relation(self, recipe, relation_model):
-        return (not self.context.get('request').user.is_anonymous
-                and relation_model.objects.filter(recipe=recipe).exists())
+    @staticmethod
+    def fragment_key(prefix, recipe):
+        author = recipe.author
+        profile = hashlib.md5('|'.join((
+            author.username, author.email, author.first_name,
+            author.last_name, author.avatar.name or ''
+        )).encode()).hexdigest()
+        return (
+            f'{prefix}:{recipe.id}:{recipe.updated_at.timestamp()}:'
+            f'{profile}'
+        )
+
+    def overlay(self, fragment, recipe):
+        '''Проставляет во фрагмент флаги текущего пользователя.'''
+        representation = dict(fragment)
+        representation['author'] = dict(
+            fragment['author'],
+            is_subscribed=self.fields['author'].get_is_subscribed(
+                recipe.author
+            )
+        )
+        representation['is_favorited'] = self.get_is_favorited(recipe)
+        representation['is_in_shopping_cart'] = (
+            self.get_is_in_shopping_cart(recipe)
+        )
+        return representation
+
+    def check_user_relation(self, recipe, relation_model, annotation):
+        # Флаги аннотируются в RecipeViewSet.get_queryset одним запросом
+        # на всю страницу; запрос к БД - только для неаннотированных
+        # объектов (например, ответ на создание рецепта).
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
+        user = self.context.get('request').user
+        return (not user.is_anonymous
+                and relation_model.objects.filter(
+                    author=user, recipe=recipe
+                ).exists())
 
     def get_is_favorited(self, recipe):
-        return self.check_user_relation(recipe, FavoriteRecipes)
+        return self.check_user_relation(
+            recipe, FavoriteRecipes, 'is_favorited'
+        )
 
     def get_is_in_shopping_cart(self, recipe):
-        return self.check_user_relation(recipe, ShoppingList)
+        return self.check_user_relation(
+            recipe, ShoppingList, 'is_in_shopping_cart'
+        )
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
@@ -98,7 +248,9 @@ class AddIngredientSerializer(serializers.ModelSerializer):
     Serializer для поля ingredients в моделе Recipe
     для добавления ингредиентов в рецепт.
     '''
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Существование продуктов проверяется одним запросом
+    # в RecipeWriteSerializer.validate_ingredients.
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=MIN_AMOUNT)
 
     class Meta:
@@ -110,8 +262,11 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     '''
     Serializer для модели Recipe - запись, обновление, удаление данных
     '''
-    image = Base64ImageField(required=True, allow_null=False)
+    image = StreamingBase64ImageField(required=True, allow_null=False)
     ingredients = AddIngredientSerializer(many=True, write_only=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), write_only=True
+    )
 
     class Meta:
         model = Recipe
@@ -124,8 +279,29 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Поле "image" не может быть пустым!'
             )
+        # При PATCH отсутствующие поля не проходят validate_<поле>.
+        if 'ingredients' not in serializer_data:
+            raise ValidationError({'ingredients': (
+                'В рецепте должен быть хотя бы один ингредиент!'
+            )})
+        if 'tags' not in serializer_data:
+            raise ValidationError({'tags': (
+                'В рецепте должен быть хотя бы один тег!'
+            )})
         return serializer_data
 
+    @staticmethod
+    def check_exist(model, ids):
+        '''Одним запросом проверяет, что все id модели существуют.'''
+        missing = set(ids) - set(
+            model.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if missing:
+            raise ValidationError(
+                f'Недопустимый первичный ключ {sorted(missing)} - '
+                'объект не существует.'
+            )
+
     def validate_ingredients(self, ingredients):
         if not ingredients:
             raise ValidationError(
@@ -137,6 +313,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise ValidationError(
                 'В рецепте не может быть повторяющихся ингредиентов!'
             )
+        self.check_exist(Ingredient, [item['id'] for item in ingredients])
         return ingredients
 
     def validate_tags(self, tags):
@@ -146,6 +323,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise ValidationError(
                 'В рецепте не может быть повторяющихся тегов!'
             )
+        self.check_exist(Tag, tags)
         return tags
 
     def to_representation(self, recipe_obj):
@@ -161,42 +339,124 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         validated_data['author'] = request.user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = super().create(validated_data)
-        self.write_data(recipe, ingredients, tags)
+        with transaction.atomic():
+            followers = FeedEntry.fanout_followers(request.user.id)
+            validated_data['fanned_out'] = followers is not None
+            recipe = super().create(validated_data)
+            self.write_data(recipe, ingredients, tags)
+            if followers:
+                FeedEntry.deliver(
+                    followers, ((recipe.id, recipe.created_at),)
+                )
+            update_search_index((recipe.id,))
+            recipe_match_index.update_on_commit({
+                recipe.id: [ingredient['id'] for ingredient in ingredients]
+            })
+            ModelVersion.bump(Recipe)
         return recipe
 
     def update(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients', [])
-        tags = validated_data.pop('tags', [])
-        self.validate_ingredients(ingredients)
-        self.validate_tags(tags)
-        recipe.recipe_ingredients.all().delete()
-        self.write_data(recipe, ingredients, tags)
-        return super().update(recipe, validated_data)
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        with transaction.atomic():
+            self.update_ingredients(recipe, {
+                ingredient['id']: ingredient['amount']
+                for ingredient in ingredients
+            })
+            recipe.tags.set(tags)
+            recipe = super().update(recipe, validated_data)
+            update_search_index((recipe.id,))
+            recipe_match_index.update_on_commit({
+                recipe.id: [ingredient['id'] for ingredient in ingredients]
+            })
+            ModelVersion.bump(Recipe)
+            return recipe
+
+    def update_ingredients(self, recipe, new_amounts):
+        '''
+        Сравнивает продукты рецепта с присланными и пишет только
+        разницу: bulk_update изменившихся количеств, bulk_create новых
+        строк и одно удаление убранных. Итоги списков покупок
+        пересчитываются на ту же разницу.
+        '''
+        rows = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe).only(
+                'id', 'ingredient_id', 'amount'
+            )
+        }
+        deltas = {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - getattr(rows.get(ingredient_id), 'amount', 0))
+            for ingredient_id in rows.keys() | new_amounts
+        }
+        changed = []
+        for ingredient_id, row in rows.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if new_amounts.keys() - rows.keys():
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                )
+                for ingredient_id, amount in new_amounts.items()
+                if ingredient_id not in rows
+            )
+        if rows.keys() - new_amounts.keys():
+            RecipeIngredient.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=rows.keys() - new_amounts.keys()
+            ).delete()
+        if any(deltas.values()):
+            ShoppingListTotal.apply_deltas(
+                ShoppingList.objects.filter(recipe=recipe).values_list(
+                    'author_id', flat=True
+                ),
+                deltas
+            )
 
     def write_data(self, recipe, ingredients, tags):
+        '''Продукты и теги нового рецепта: по одной вставке.'''
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=ingredient['id'],
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients
         )
-        recipe.tags.set(tags)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+            for tag_id in tags
+        )
 
 
 class RecipeMiniSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscriptionsSerializerFoodgram(FoodgramUserSerializer):
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True
-    )
+    '''
+    Serializer для подписок. Ожидает авторов из subscribed_authors:
+    с аннотацией recipes_count и превью рецептов в recipe_previews.
+    '''
+    recipes_count = serializers.IntegerField(read_only=True)
     recipes = serializers.SerializerMethodField()
 
+    collapsed_fields = {
+        'recipes': partial(
+            serializers.PrimaryKeyRelatedField, many=True, read_only=True,
+            source='recipe_previews'
+        ),
+    }
+
     class Meta:
         model = User
         fields = (
@@ -204,15 +464,4 @@ class SubscriptionsSerializerFoodgram(FoodgramUserSerializer):
         )
 
     def get_recipes(self, author):
-        recipes_limit = self.context['request'].GET.get(
-            'recipes_limit', 10**10
-        )
-        try:
-            recipes_limit = int(recipes_limit)
-        except ValueError:
-            raise serializers.ValidationError(
-                {'limit': 'Параметр должен быть целым числом!'}
-            )
-        return RecipeMiniSerializer(
-            author.recipes.all()[:recipes_limit], many=True
-        ).data
+        return RecipeMiniSerializer(author.recipe_previews, many=True).data
@@ -1,44 +1,87 @@
-from collections import defaultdict
+import csv
+import json
 from datetime import date
 
 HEADER_TEMPLATE = "Список покупок от {date}"
 PRODUCT_TEMPLATE = "{index}) {description} - {amount}"
 RECIPE_TEMPLATE = "{index}) {name}"
+CSV_HEADER = ('Продукт', 'Ед. измерения', 'Количество')
+CSV_RECIPES_HEADER = ('Рецепт',)
 
 
-def shopping_cart(filling_basket):
-    header = HEADER_TEMPLATE.format(date=date.today().strftime('%d.%m.%Y'))
-    ingredient_groups = defaultdict(lambda: 0)
-    recipes = set()
-    for ingredient in filling_basket:
-        ingredient_key = (
-            ingredient['ingredient__name'].capitalize(),
-            ingredient['ingredient__measurement_unit']
-        )
-        ingredient_groups[ingredient_key] += ingredient['total_amount']
-        recipes.add(ingredient['recipe__name'])
-    sorted_ingredients = sorted(
-        ingredient_groups.items(),
-        key=lambda item: item[0][0]
-    )
-    products = [
-        PRODUCT_TEMPLATE.format(
+class Echo:
+    '''Псевдо-буфер для csv.writer: возвращает строку вместо записи.'''
+
+    def write(self, value):
+        return value
+
+
+def today():
+    return date.today().strftime('%d.%m.%Y')
+
+
+def render_txt(ingredients, recipes):
+    yield HEADER_TEMPLATE.format(date=today())
+    yield '\nСписок ингредиентов:'
+    for index, ingredient in enumerate(ingredients, start=1):
+        yield '\n' + PRODUCT_TEMPLATE.format(
             index=index,
-            description=f"{name} ({unit})",
-            amount=total_amount
+            description=(f"{ingredient['ingredient__name'].capitalize()} "
+                         f"({ingredient['ingredient__measurement_unit']})"),
+            amount=ingredient['total_amount']
         )
-        for index, ((name, unit), total_amount) in enumerate(
-            sorted_ingredients, start=1
-        )
-    ]
-    recipes_list = [
-        RECIPE_TEMPLATE.format(index=index, name=recipe)
-        for index, recipe in enumerate(sorted(recipes), start=1)
-    ]
-    return '\n'.join([
-        header,
-        'Список ингредиентов:',
-        *products,
-        'Список рецептов:',
-        *recipes_list,
-    ])
+    yield '\nСписок рецептов:'
+    for index, name in enumerate(recipes, start=1):
+        yield '\n' + RECIPE_TEMPLATE.format(index=index, name=name)
+
+
+def render_csv(ingredients, recipes):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'].capitalize(),
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total_amount'],
+        ))
+    # Рецепты - отдельной таблицей после пустой строки.
+    yield writer.writerow(())
+    yield writer.writerow(CSV_RECIPES_HEADER)
+    for name in recipes:
+        yield writer.writerow((name,))
+
+
+def render_json(ingredients, recipes):
+    yield f'{{"date": {json.dumps(today())}, "ingredients": ['
+    for index, ingredient in enumerate(ingredients):
+        yield (',' if index else '') + json.dumps({
+            'name': ingredient['ingredient__name'].capitalize(),
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['total_amount'],
+        }, ensure_ascii=False)
+    yield '], "recipes": ['
+    for index, name in enumerate(recipes):
+        yield (',' if index else '') + json.dumps(name, ensure_ascii=False)
+    yield ']}'
+
+
+# Формат выгрузки -> (генератор документа, content type, расширение файла).
+RENDERERS = {
+    'txt': (render_txt, 'text/plain', 'txt'),
+    'csv': (render_csv, 'text/csv', 'csv'),
+    'json': (render_json, 'application/json', 'json'),
+}
+
+
+def shopping_cart(ingredients, recipes, export_format='txt'):
+    '''
+    Возвращает генератор документа списка покупок, его content type
+    и имя файла. ingredients - агрегированные в БД строки
+    (название, ед. измерения, total_amount), recipes - названия рецептов.
+    '''
+    render, content_type, extension = RENDERERS[export_format]
+    return (
+        render(ingredients, recipes),
+        content_type,
+        f'shop_list.{extension}'
+    )
@@ -1,63 +1,278 @@
-from io import BytesIO
-
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Count, Exists, F, OuterRef, Prefetch, Value, Window
+)
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.decorators import method_decorator
+from django.views.decorators.vary import vary_on_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly
 )
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
-from .paginations import ApiPagination
+from .conditional import (
+    ingredient_condition, recipe_condition, tag_condition
+)
+from .fieldsets import SparseFieldsViewMixin
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .paginations import PAGINATION_MODES, ApiPagination
 from .permissions import IsOwnerOrReadOnly
+from .recipe_match_index import recipe_match_index
+from .response_cache import anonymous_response_cache
 from .serializers import (
     FoodgramUserSerializer, IngredientSerializer,
     RecipeMiniSerializer, RecipeReadSerializer,
     RecipeWriteSerializer, SubscriptionsSerializerFoodgram,
     TagSerializer
 )
-from .shopping_cart import shopping_cart
+from .shopping_cart import RENDERERS, shopping_cart
 from recipes.models import (
-    Ingredient, FavoriteRecipes,
-    Recipe, ShoppingList, Subscriptions,
-    Tag, RecipeIngredient, User
+    Ingredient, FavoriteRecipes, FeedEntry,
+    ModelVersion, Recipe, ShoppingList, ShoppingListTotal,
+    Subscriptions, Tag, RecipeIngredient, User
 )
 
 
+def user_flags(user):
+    '''
+    Аннотации флагов текущего пользователя для рецептов: is_favorited,
+    is_in_shopping_cart и author_is_subscribed (подписка на автора).
+    '''
+    if not user.is_authenticated:
+        return {
+            name: Value(False, output_field=BooleanField())
+            for name in ('is_favorited', 'is_in_shopping_cart',
+                         'author_is_subscribed')
+        }
+    return {
+        'is_favorited': Exists(FavoriteRecipes.objects.filter(
+            author=user, recipe=OuterRef('pk')
+        )),
+        'is_in_shopping_cart': Exists(ShoppingList.objects.filter(
+            author=user, recipe=OuterRef('pk')
+        )),
+        'author_is_subscribed': Exists(Subscriptions.objects.filter(
+            user=user, author=OuterRef('author')
+        )),
+    }
+
+
+def recipe_feed_queryset(user, recipes=None, prefetch=True):
+    '''
+    Queryset ленты рецептов с постоянным числом запросов на страницу:
+    автор, теги и продукты загружаются вместе со страницей, а флаги
+    is_favorited, is_in_shopping_cart и is_subscribed (автора)
+    вычисляются подзапросами для текущего пользователя.
+    С prefetch=False теги и продукты не загружаются: RecipeReadSerializer
+    догружает их только для рецептов, которых нет в кэше фрагментов.
+    '''
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    recipes = recipes.select_related('author')
+    if prefetch:
+        recipes = recipes.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+    return recipes.annotate(**user_flags(user))
+
+
+def sparse_recipe_queryset(user, recipes, fields, expand):
+    '''
+    Queryset под ?fields=: читаются только нужные полям столбцы, автор
+    присоединяется, а теги и продукты догружаются, только если они
+    запрошены; без expand - одни идентификаторы. Флаги пользователя
+    вычисляются только запрошенные.
+    '''
+    recipes = recipes.only(
+        'created_at', *RecipeReadSerializer.columns(fields)
+    )
+    flags = {name for name in ('is_favorited', 'is_in_shopping_cart')
+             if name in fields}
+    if 'author' in fields and 'author' in expand:
+        recipes = recipes.select_related('author')
+        flags.add('author_is_subscribed')
+    if 'tags' in fields:
+        recipes = recipes.prefetch_related(
+            'tags' if 'tags' in expand
+            else Prefetch('tags', queryset=Tag.objects.only('id'))
+        )
+    if 'ingredients' in fields:
+        recipes = recipes.prefetch_related(Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+            if 'ingredients' in expand
+            else RecipeIngredient.objects.only('recipe', 'ingredient')
+        ))
+    return recipes.annotate(**{
+        name: flag for name, flag in user_flags(user).items()
+        if name in flags
+    })
+
+
+def subscribed_authors(user, fields=None):
+    '''
+    Авторы, на которых подписан пользователь, с числом рецептов.
+    Превью рецептов добавляются отдельно в attach_recipe_previews.
+    С fields (?fields=) читаются только нужные полям столбцы.
+    '''
+    authors = User.objects.filter(authors__user=user).annotate(
+        is_subscribed=Value(True, output_field=BooleanField())
+    )
+    if fields is not None:
+        authors = authors.only(
+            *SubscriptionsSerializerFoodgram.columns(fields)
+        )
+    if fields is None or 'recipes_count' in fields:
+        authors = authors.annotate(recipes_count=Count('recipes'))
+    return authors
+
+
+def attach_recipe_previews(authors, recipes_limit=None):
+    '''
+    Загружает первые recipes_limit рецептов каждого автора одним
+    оконным запросом (ROW_NUMBER() OVER (PARTITION BY author_id)).
+    '''
+    authors = list(authors)
+    previews = {author.id: [] for author in authors}
+    recipes = Recipe.objects.filter(author__in=previews).only(
+        'id', 'name', 'image', 'cooking_time', 'author_id'
+    )
+    if recipes_limit is not None:
+        recipes = recipes.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=Recipe._meta.ordering
+            )
+        ).filter(row_number__lte=recipes_limit)
+    for recipe in recipes.order_by('author_id', *Recipe._meta.ordering):
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipe_previews = previews[author.id]
+    return authors
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    try:
+        return int(recipes_limit)
+    except ValueError:
+        raise ValidationError(
+            {'limit': 'Параметр должен быть целым числом!'}
+        )
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    '''
+    Параметр ?format= выбирает формат выгружаемого файла, а не рендерер
+    DRF, поэтому для ответов об ошибках всегда берётся первый рендерер.
+    '''
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
 def redirect_to_recipe(request, pk):
     if not Recipe.objects.filter(pk=pk).exists():
         raise ValidationError(f'Рецепт с идентификатором {pk} не найден!')
     return redirect(f'/recipes/{pk}/')
 
 
+@method_decorator(tag_condition, name='list')
+@method_decorator(tag_condition, name='retrieve')
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
+@method_decorator(ingredient_condition, name='list')
+@method_decorator(ingredient_condition, name='retrieve')
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
-    search_fields = ('^name',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        '''Список и поиск по префиксу ?name= из индекса, без запросов к БД.'''
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''),
+            settings.INGREDIENT_SEARCH_LIMIT
+        ))
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all().order_by('-created_at')
+
+@method_decorator(
+    (vary_on_headers('Authorization'), recipe_condition), name='retrieve'
+)
+class RecipeViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.all().order_by('-created_at', '-id')
     pagination_class = ApiPagination
     permission_classes = (IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly,)
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    sparse_actions = {
+        'list': RecipeReadSerializer,
+        'retrieve': RecipeReadSerializer,
+        'feed': RecipeReadSerializer,
+    }
+
+    @property
+    def paginator(self):
+        '''
+        Режим пагинации выбирается параметром ?pagination=
+        (page, nocount, cursor); по умолчанию - постраничный.
+        '''
+        if not hasattr(self, '_paginator'):
+            mode = self.request.query_params.get('pagination', 'page')
+            if mode not in PAGINATION_MODES:
+                raise ValidationError({
+                    'pagination': 'Доступные режимы: '
+                                  f'{", ".join(PAGINATION_MODES)}.'
+                })
+            self._paginator = PAGINATION_MODES[mode]()
+        return self._paginator
+
+    def get_queryset(self):
+        fields, expand = self.fieldset
+        if fields is not None:
+            return sparse_recipe_queryset(
+                self.request.user, self.queryset, fields, expand
+            )
+        return recipe_feed_queryset(
+            self.request.user, self.queryset, prefetch=False
+        )
+
+    def perform_destroy(self, recipe):
+        with transaction.atomic():
+            recipe.delete()
+            ModelVersion.bump(Recipe)
+
+    @anonymous_response_cache
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @anonymous_response_cache
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update', 'destroy'):
@@ -74,25 +289,113 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'short-link': f'http://{request.get_host()}/s/{pk}'
         })
 
+    @action(detail=True)
+    def related(self, request, pk=None):
+        '''
+        Похожие рецепты по индексу RelatedRecipe: их чаще всего
+        добавляют в избранное и корзину вместе с этим.
+        '''
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        return Response(RecipeMiniSerializer(
+            Recipe.objects.filter(neighbor_of__recipe=recipe).order_by(
+                '-neighbor_of__score', 'id'
+            ).only('id', 'name', 'image', 'cooking_time'),
+            many=True, context=self.get_serializer_context()
+        ).data)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        '''
+        Лента рецептов авторов из подписок: разосланные рецепты берутся
+        из FeedEntry пользователя, рецепты популярных авторов
+        (fanned_out=False) - напрямую по подпискам.
+        '''
+        user = request.user
+        recipes = self.get_queryset().filter(id__in=FeedEntry.objects.filter(
+            user=user
+        ).values('recipe').union(Recipe.objects.filter(
+            fanned_out=False, author__in=Subscriptions.objects.filter(
+                user=user
+            ).values('author')
+        ).order_by().values('id')))
+        page = self.paginate_queryset(self.filter_queryset(recipes))
+        return self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
+    @action(detail=False, url_path='what-to-cook')
+    def what_to_cook(self, request):
+        '''
+        Что приготовить из продуктов ?ingredients= (id, параметр
+        повторяется), если докупить не больше ?missing= продуктов.
+        Лучшие совпадения - первыми; подбор идёт по индексу в памяти.
+        '''
+        try:
+            ingredient_ids = {
+                int(ingredient_id)
+                for ingredient_id in request.query_params.getlist(
+                    'ingredients'
+                )
+            }
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': 'Укажите id продуктов целыми числами.'}
+            )
+        if not ingredient_ids:
+            raise ValidationError(
+                {'ingredients': 'Укажите хотя бы один продукт.'}
+            )
+        try:
+            max_missing = int(request.query_params.get('missing', 0))
+        except ValueError:
+            max_missing = -1
+        if not 0 <= max_missing <= settings.RECIPE_MATCH_MAX_MISSING:
+            raise ValidationError({
+                'missing': 'Допустимо целое число от 0 до '
+                           f'{settings.RECIPE_MATCH_MAX_MISSING}.'
+            })
+        if request.query_params.get('pagination') == 'cursor':
+            raise ValidationError(
+                {'pagination': 'Не поддерживается для подбора рецептов.'}
+            )
+        page = self.paginate_queryset(
+            recipe_match_index.match(ingredient_ids, max_missing)
+        )
+        recipes = self.get_queryset().in_bulk(
+            recipe_id for recipe_id, _, _ in page
+        )
+        page = [match for match in page if match[0] in recipes]
+        data = RecipeReadSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page],
+            many=True, context=self.get_serializer_context()
+        ).data
+        return self.get_paginated_response([
+            {**recipe, 'ingredients_found': found,
+             'ingredients_missing': missing}
+            for recipe, (_, found, missing) in zip(data, page)
+        ])
+
     @staticmethod
     def favorite_and_cart(model, request, kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['pk'])
         user = request.user
-        if request.method == 'POST':
-            _, created = model.objects.get_or_create(
-                author=user, recipe=recipe
-            )
-            if not created:
-                raise ValidationError(
-                    {'detail': 'Уже добавлено!'}
+        # Счётчики рецепта и итоги корзины меняют сигналы связи.
+        with transaction.atomic(savepoint=False):
+            if request.method == 'POST':
+                _, created = model.objects.get_or_create(
+                    author=user, recipe=recipe
                 )
-            return Response(
-                RecipeMiniSerializer(recipe).data,
-                status=status.HTTP_201_CREATED
-            )
-        if request.method == 'DELETE':
-            get_object_or_404(model, author=user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+                if not created:
+                    raise ValidationError(
+                        {'detail': 'Уже добавлено!'}
+                    )
+                return Response(
+                    RecipeMiniSerializer(recipe).data,
+                    status=status.HTTP_201_CREATED
+                )
+            if request.method == 'DELETE':
+                get_object_or_404(model, author=user, recipe=recipe).delete()
+                return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True,
             methods=('post', 'delete'),
@@ -101,27 +404,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.favorite_and_cart(ShoppingList, request, kwargs)
 
     @action(detail=False,
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            content_negotiation_class=ExportContentNegotiation)
     def download_shopping_cart(self, request):
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in RENDERERS:
+            raise ValidationError(
+                {'format': f'Доступные форматы: {", ".join(RENDERERS)}.'}
+            )
         if not ShoppingList.objects.filter(author=request.user).exists():
             return Response(
                 'Список покупок пуст!',
                 status=status.HTTP_404_NOT_FOUND
             )
-        filling_basket = RecipeIngredient.objects.filter(
-            recipe__shoppinglist__author=request.user
+        ingredients = ShoppingListTotal.objects.filter(
+            user=request.user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit', 'recipe__name'
-        ).annotate(
-            total_amount=Sum('amount')
+            'ingredient__name', 'ingredient__measurement_unit',
+            'total_amount'
         ).order_by('ingredient__name')
-
-        return FileResponse(
-            BytesIO(shopping_cart(filling_basket).encode('utf-8')),
-            as_attachment=True,
-            filename='shop_list.txt',
-            content_type='text/plain'
+        recipes = Recipe.objects.filter(
+            shoppinglist__author=request.user
+        ).values_list('name', flat=True).distinct().order_by('name')
+        content, content_type, filename = shopping_cart(
+            ingredients.iterator(), recipes.iterator(), export_format
+        )
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{filename}"'
         )
+        return response
 
     @action(detail=True,
             methods=('post', 'delete'),
@@ -130,8 +442,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.favorite_and_cart(FavoriteRecipes, request, kwargs)
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(SparseFieldsViewMixin, UserViewSet):
     queryset = User.objects.all()
+    sparse_actions = {
+        'list': FoodgramUserSerializer,
+        'retrieve': FoodgramUserSerializer,
+        'me': FoodgramUserSerializer,
+        'subscriptions': SubscriptionsSerializerFoodgram,
+    }
+
+    def get_queryset(self):
+        users = super().get_queryset()
+        fields, _ = self.fieldset
+        if fields is None:
+            return users
+        users = users.only(*FoodgramUserSerializer.columns(fields))
+        if 'is_subscribed' in fields and self.request.user.is_authenticated:
+            users = users.annotate(is_subscribed=Exists(
+                Subscriptions.objects.filter(
+                    user=self.request.user, author=OuterRef('pk')
+                )
+            ))
+        return users
 
     @action(detail=False,
             methods=('get',),
@@ -146,38 +478,51 @@ class UserViewSet(UserViewSet):
         '''Создать и/или удалить подписку'''
         author = get_object_or_404(User, id=kwargs['id'])
         if request.method == 'DELETE':
-            get_object_or_404(
-                Subscriptions, user=request.user, author=author
-            ).delete()
+            with transaction.atomic():
+                get_object_or_404(
+                    Subscriptions, user=request.user, author=author
+                ).delete()
+                FeedEntry.objects.filter(
+                    user=request.user, recipe__author=author
+                ).delete()
             return Response(
                 'Успешная отписка',
                 status=status.HTTP_204_NO_CONTENT
             )
         if request.user == author:
             raise ValidationError('Подписка на себя невозможна!')
-        _, created = Subscriptions.objects.get_or_create(
-            user=request.user, author=author
-        )
-        if not created:
-            raise ValidationError(
-                f'Вы уже подписаны на пользователя {author}!'
+        with transaction.atomic():
+            _, created = Subscriptions.objects.get_or_create(
+                user=request.user, author=author
             )
+            if not created:
+                raise ValidationError(
+                    f'Вы уже подписаны на пользователя {author}!'
+                )
+            FeedEntry.subscribe(request.user.id, author.id)
         return Response(SubscriptionsSerializerFoodgram(
-            author, context={'request': request, }
+            attach_recipe_previews(
+                subscribed_authors(request.user).filter(id=author.id),
+                get_recipes_limit(request)
+            )[0], context={'request': request}
         ).data, status=status.HTTP_201_CREATED)
 
-    @action(detail=False)
+    @action(detail=False,
+            permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         '''Отобразить все подписки пользователя'''
-        user_subscriptions = Subscriptions.objects.filter(
-            user=self.request.user
-        ).values_list('author', flat=True)
+        fields, _ = self.fieldset
+        authors = self.paginate_queryset(
+            subscribed_authors(request.user, fields)
+        )
+        if fields is None or 'recipes' in fields:
+            authors = attach_recipe_previews(
+                authors, get_recipes_limit(request)
+            )
         return self.get_paginated_response(
             SubscriptionsSerializerFoodgram(
-                self.paginate_queryset(
-                    User.objects.filter(id__in=user_subscriptions)
-                ), many=True,
-                context={'request': request}
+                authors, many=True, context={'request': request},
+                **self.sparse_kwargs()
             ).data
         )
 
@@ -188,7 +533,8 @@ class UserViewSet(UserViewSet):
         '''Добавить или изменить аватар пользователя'''
         user = self.request.user
         if request.method == 'DELETE':
-            user.avatar.delete(save=False)
+            # Файл может быть общим с другими пользователями: его удалит
+            # gc_media, когда на него не останется ссылок.
             user.avatar = None
             user.save()
             return Response(
@@ -0,0 +1,284 @@
+"""Замеры числа запросов, задержки и объёма ответов для эндпоинтов API."""
+import base64
+import io
+import statistics
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.urls import router
+from recipes.models import (
+    FavoriteRecipes, Ingredient,
+    Recipe, ShoppingList,
+    Subscriptions, Tag, User
+)
+from .generator import PASSWORD
+
+
+Case = namedtuple('Case', ('name', 'route', 'method', 'url', 'client', 'data'))
+Result = namedtuple(
+    'Result', ('name', 'status', 'queries', 'p50_ms', 'p95_ms', 'bytes')
+)
+
+# Маршруты, не относящиеся к роутеру api.urls, но подключённые в api/.
+EXTRA_ROUTES = ('login', 'logout')
+# Почтовые сценарии djoser не настроены в проекте (нет URL подтверждения
+# и отправки писем), поэтому не замеряются.
+IGNORED_ROUTES = (
+    'api-root',
+    'user-activation', 'user-resend-activation',
+    'user-reset-password', 'user-reset-password-confirm',
+    'user-reset-username', 'user-reset-username-confirm',
+)
+
+# Страницы ленты разного размера: число запросов у них должно совпадать
+# (план запросов recipe_feed_queryset не зависит от числа рецептов).
+CONSTANT_QUERY_CASES = (
+    'recipes: лента', 'recipes: лента, limit=60', 'recipes: лента, limit=600'
+)
+
+
+def image_base64(size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def recipe_payload():
+    return {
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in Ingredient.objects.values_list(
+                'id', flat=True
+            )[:5]
+        ],
+        'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+        'name': 'Рецепт бенчмарка',
+        'image': image_base64(),
+        'text': 'Описание рецепта бенчмарка',
+        'cooking_time': 30,
+    }
+
+
+def edit_payload(recipe, name=None, amount_delta=0):
+    """Правка рецепта с его же продуктами и тегами."""
+    return {
+        'ingredients': [
+            {'id': ingredient_id, 'amount': amount + amount_delta}
+            for ingredient_id, amount in recipe.recipe_ingredients.values_list(
+                'ingredient_id', 'amount'
+            )
+        ],
+        'tags': list(recipe.tags.values_list('id', flat=True)),
+        'name': name or recipe.name,
+        'image': image_base64(),
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def build_cases(users):
+    """Сценарии для всех маршрутов API на сгенерированных данных."""
+    reader, author = users[0], users[1]
+    clients = {'anon': APIClient(), 'reader': APIClient()}
+    clients['reader'].credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=reader).key}'
+    )
+    own_recipe = Recipe.objects.filter(author=reader).first()
+    favorited = FavoriteRecipes.objects.filter(author=reader).first().recipe
+    in_cart = ShoppingList.objects.filter(author=reader).first().recipe
+    not_related = Recipe.objects.exclude(
+        favoriterecipes__author=reader
+    ).exclude(shoppinglist__author=reader).first()
+    followed = Subscriptions.objects.filter(user=reader).first().author
+    not_followed = User.objects.exclude(
+        authors__user=reader
+    ).exclude(id=reader.id).first()
+    tags = '&'.join(
+        f'tags={slug}' for slug in Tag.objects.values_list('slug', flat=True)
+    )
+    pantry = '&'.join(
+        f'ingredients={ingredient_id}'
+        for ingredient_id in own_recipe.recipe_ingredients.values_list(
+            'ingredient_id', flat=True
+        )
+    )
+    ingredient = Ingredient.objects.first()
+    tag = Tag.objects.first()
+    return [
+        Case('recipes: лента (аноним)', 'recipe-list', 'get',
+             '/api/recipes/', 'anon', None),
+        Case('recipes: лента', 'recipe-list', 'get',
+             '/api/recipes/', 'reader', None),
+        Case('recipes: лента, limit=60', 'recipe-list', 'get',
+             '/api/recipes/?limit=60', 'reader', None),
+        Case('recipes: лента, limit=600', 'recipe-list', 'get',
+             '/api/recipes/?limit=600', 'reader', None),
+        Case('recipes: лента, курсор', 'recipe-list', 'get',
+             '/api/recipes/?pagination=cursor', 'reader', None),
+        Case('recipes: лента, карточки', 'recipe-list', 'get',
+             '/api/recipes/?fields=id,name,image,cooking_time,tags,author'
+             '&expand=tags,author', 'reader', None),
+        Case('recipes: лента без count', 'recipe-list', 'get',
+             '/api/recipes/?pagination=nocount&page=5', 'reader', None),
+        Case('recipes: фильтр по тегам', 'recipe-list', 'get',
+             f'/api/recipes/?{tags}', 'reader', None),
+        Case('recipes: фильтр по автору', 'recipe-list', 'get',
+             f'/api/recipes/?author={author.id}', 'reader', None),
+        Case('recipes: популярные', 'recipe-list', 'get',
+             '/api/recipes/?ordering=popular', 'reader', None),
+        Case('recipes: поиск', 'recipe-list', 'get',
+             '/api/recipes/?search=рецепт 12', 'reader', None),
+        Case('recipes: лента подписок', 'recipe-feed', 'get',
+             '/api/recipes/feed/', 'reader', None),
+        Case('recipes: что приготовить', 'recipe-what-to-cook', 'get',
+             f'/api/recipes/what-to-cook/?{pantry}&missing=1', 'reader',
+             None),
+        Case('recipes: избранное', 'recipe-list', 'get',
+             '/api/recipes/?is_favorited=1', 'reader', None),
+        Case('recipes: в корзине', 'recipe-list', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', 'reader', None),
+        Case('recipes: создание', 'recipe-list', 'post',
+             '/api/recipes/', 'reader', recipe_payload()),
+        Case('recipes: рецепт', 'recipe-detail', 'get',
+             f'/api/recipes/{own_recipe.id}/', 'reader', None),
+        Case('recipes: изменение', 'recipe-detail', 'patch',
+             f'/api/recipes/{own_recipe.id}/', 'reader', recipe_payload()),
+        Case('recipes: изменение названия', 'recipe-detail', 'patch',
+             f'/api/recipes/{own_recipe.id}/', 'reader',
+             edit_payload(own_recipe, name='Новое название')),
+        Case('recipes: изменение количеств', 'recipe-detail', 'patch',
+             f'/api/recipes/{own_recipe.id}/', 'reader',
+             edit_payload(own_recipe, amount_delta=1)),
+        Case('recipes: удаление', 'recipe-detail', 'delete',
+             f'/api/recipes/{own_recipe.id}/', 'reader', None),
+        Case('recipes: похожие', 'recipe-related', 'get',
+             f'/api/recipes/{favorited.id}/related/', 'reader', None),
+        Case('recipes: короткая ссылка', 'recipe-get-link', 'get',
+             f'/api/recipes/{own_recipe.id}/get-link/', 'reader', None),
+        Case('recipes: в избранное', 'recipe-favorite', 'post',
+             f'/api/recipes/{not_related.id}/favorite/', 'reader', None),
+        Case('recipes: из избранного', 'recipe-favorite', 'delete',
+             f'/api/recipes/{favorited.id}/favorite/', 'reader', None),
+        Case('recipes: в корзину', 'recipe-shopping-cart', 'post',
+             f'/api/recipes/{not_related.id}/shopping_cart/', 'reader',
+             None),
+        Case('recipes: из корзины', 'recipe-shopping-cart', 'delete',
+             f'/api/recipes/{in_cart.id}/shopping_cart/', 'reader', None),
+        Case('recipes: список покупок', 'recipe-download-shopping-cart',
+             'get', '/api/recipes/download_shopping_cart/', 'reader', None),
+        Case('recipes: список покупок, csv',
+             'recipe-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', 'reader',
+             None),
+        Case('recipes: список покупок, json',
+             'recipe-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/?format=json', 'reader',
+             None),
+        Case('tags: список', 'tag-list', 'get', '/api/tags/', 'anon', None),
+        Case('tags: тег', 'tag-detail', 'get',
+             f'/api/tags/{tag.id}/', 'anon', None),
+        Case('ingredients: список', 'ingredient-list', 'get',
+             '/api/ingredients/', 'anon', None),
+        Case('ingredients: поиск', 'ingredient-list', 'get',
+             f'/api/ingredients/?name={ingredient.name[:2]}', 'anon', None),
+        Case('ingredients: продукт', 'ingredient-detail', 'get',
+             f'/api/ingredients/{ingredient.id}/', 'anon', None),
+        Case('users: список', 'user-list', 'get',
+             '/api/users/', 'anon', None),
+        Case('users: регистрация', 'user-list', 'post', '/api/users/',
+             'anon', {'email': 'new@benchmark.ru', 'username': 'new',
+                      'first_name': 'Имя', 'last_name': 'Фамилия',
+                      'password': 'Str0ng-benchmark-pass'}),
+        Case('users: список, fields', 'user-list', 'get',
+             '/api/users/?fields=id,username,first_name,last_name',
+             'reader', None),
+        Case('users: профиль', 'user-detail', 'get',
+             f'/api/users/{author.id}/', 'reader', None),
+        Case('users: me', 'user-me', 'get', '/api/users/me/', 'reader', None),
+        Case('users: подписки', 'user-subscriptions', 'get',
+             '/api/users/subscriptions/', 'reader', None),
+        Case('users: подписки, recipes_limit=3', 'user-subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', 'reader', None),
+        Case('users: подписаться', 'user-subscribe', 'post',
+             f'/api/users/{not_followed.id}/subscribe/', 'reader', None),
+        Case('users: отписаться', 'user-subscribe', 'delete',
+             f'/api/users/{followed.id}/subscribe/', 'reader', None),
+        Case('users: аватар', 'user-avatar', 'put',
+             '/api/users/me/avatar/', 'reader', {'avatar': image_base64()}),
+        Case('users: удаление аватара', 'user-avatar', 'delete',
+             '/api/users/me/avatar/', 'reader', None),
+        Case('users: смена пароля', 'user-set-password', 'post',
+             '/api/users/set_password/', 'reader',
+             {'current_password': PASSWORD,
+              'new_password': 'Str0ng-benchmark-pass'}),
+        Case('users: смена username', 'user-set-username', 'post',
+             '/api/users/set_email/', 'reader',
+             {'current_password': PASSWORD, 'new_email': 'a@benchmark.ru'}),
+        Case('auth: вход', 'login', 'post', '/api/auth/token/login/',
+             'anon', {'email': author.email, 'password': PASSWORD}),
+        Case('auth: выход', 'logout', 'post', '/api/auth/token/logout/',
+             'reader', None),
+    ], clients
+
+
+def uncovered_routes(cases):
+    routes = {pattern.name for pattern in router.urls} | set(EXTRA_ROUTES)
+    return sorted(
+        routes - set(IGNORED_ROUTES) - {case.route for case in cases}
+    )
+
+
+def query_count_mismatches(results):
+    """Сценарии CONSTANT_QUERY_CASES с разным числом запросов."""
+    queries = {
+        result.name: result.queries for result in results
+        if result.name in CONSTANT_QUERY_CASES
+    }
+    if len(set(queries.values())) <= 1:
+        return []
+    return [f'{name}: {count}' for name, count in queries.items()]
+
+
+def response_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def run_case(case, client, repeat):
+    """
+    Выполняет сценарий repeat раз; изменения каждого прогона
+    откатываются, а кэш очищается, чтобы все прогоны шли на одинаковых
+    данных и замерялся путь без кэша.
+    """
+    timings = []
+    for _ in range(repeat):
+        cache.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, case.method)(
+                    case.url, case.data, format='json'
+                )
+                size = response_size(response)
+                timings.append((time.perf_counter() - started) * 1000)
+            transaction.set_rollback(True)
+    timings.sort()
+    return Result(
+        name=case.name,
+        status=response.status_code,
+        queries=len(queries.captured_queries),
+        p50_ms=round(statistics.median(timings), 2),
+        p95_ms=round(timings[max(0, round(len(timings) * 0.95) - 1)], 2),
+        bytes=size,
+    )
@@ -0,0 +1,31 @@
+"""Временная тестовая БД для бенчмарков."""
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment
+)
+
+
+FAST_HASHERS = ('django.contrib.auth.hashers.MD5PasswordHasher',)
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Создаёт тестовую БД (test_<имя>, для SQLite - в памяти) и удаляет её
+    по выходе; медиафайлы пишутся во временный каталог.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root,
+                                  PASSWORD_HASHERS=FAST_HASHERS):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
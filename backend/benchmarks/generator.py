@@ -0,0 +1,117 @@
+"""Генератор синтетических данных для бенчмарков."""
+import io
+import json
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+
+from recipes.models import (
+    FavoriteRecipes, Ingredient,
+    Recipe, RecipeIngredient,
+    ShoppingList, Subscriptions,
+    Tag, User
+)
+
+
+INGREDIENTS_FILE = settings.BASE_DIR / 'data' / 'ingredients.json'
+TAGS_FILE = settings.BASE_DIR / 'data' / 'tags.json'
+PASSWORD = 'benchmark-password'
+IMAGE_NAME = 'media/benchmark.png'
+INGREDIENTS_PER_RECIPE = (3, 10)
+TAGS_PER_RECIPE = (1, 3)
+BATCH_SIZE = 1000
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def generate(users=20, recipes=200, ingredients=500, favorites=10,
+             carts=5, subscriptions=5, seed=0):
+    """
+    Заполняет БД детерминированным набором данных.
+
+    favorites, carts и subscriptions задаются на одного пользователя.
+    Возвращает список созданных пользователей.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        User(
+            username=f'user{index}',
+            email=f'user{index}@benchmark.ru',
+            first_name=f'Имя{index}',
+            last_name=f'Фамилия{index}',
+            password=password,
+        ) for index in range(users)
+    )
+    users = list(User.objects.order_by('id'))
+    Ingredient.objects.bulk_create(
+        (Ingredient(**item)
+         for item in load_json(INGREDIENTS_FILE)[:ingredients]),
+        batch_size=BATCH_SIZE
+    )
+    Tag.objects.bulk_create(Tag(**item) for item in load_json(TAGS_FILE))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        (Recipe(
+            author=users[index % len(users)],
+            name=f'Рецепт {index}',
+            text=f'Описание рецепта {index}. ' * 10,
+            image=IMAGE_NAME,
+            cooking_time=rng.randint(1, 180),
+        ) for index in range(recipes)),
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    RecipeIngredient.objects.bulk_create(
+        (RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                          amount=rng.randint(1, 500))
+         for recipe_id in recipe_ids
+         for ingredient_id in rng.sample(
+             ingredient_ids,
+             min(rng.randint(*INGREDIENTS_PER_RECIPE), len(ingredient_ids))
+        )),
+        batch_size=BATCH_SIZE
+    )
+    RecipeTag = Recipe.tags.through
+    RecipeTag.objects.bulk_create(
+        (RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+         for recipe_id in recipe_ids
+         for tag_id in rng.sample(
+             tag_ids, min(rng.randint(*TAGS_PER_RECIPE), len(tag_ids))
+        )),
+        batch_size=BATCH_SIZE
+    )
+    for model, per_user in ((FavoriteRecipes, favorites),
+                            (ShoppingList, carts)):
+        model.objects.bulk_create(
+            (model(author=user, recipe_id=recipe_id)
+             for user in users
+             for recipe_id in rng.sample(
+                 recipe_ids, min(per_user, len(recipe_ids))
+            )),
+            batch_size=BATCH_SIZE
+        )
+    Subscriptions.objects.bulk_create(
+        (Subscriptions(user=user, author=author)
+         for user in users
+         for author in rng.sample(
+             [author for author in users if author != user],
+             min(subscriptions, len(users) - 1)
+        )),
+        batch_size=BATCH_SIZE
+    )
+    call_command('rebuild_shopping_totals', stdout=io.StringIO())
+    call_command('rebuild_recipe_counters', stdout=io.StringIO())
+    call_command('rebuild_search_index', stdout=io.StringIO())
+    call_command('rebuild_feed_inboxes', stdout=io.StringIO())
+    # Данных мало: любая общая пара уже сигнал.
+    call_command(
+        'compute_related_recipes', min_support=1, stdout=io.StringIO()
+    )
+    return users
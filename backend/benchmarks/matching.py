@@ -0,0 +1,114 @@
+"""
+Подбор рецептов по продуктам («что приготовить») на синтетическом
+каталоге: инвертированный индекс api.recipe_match_index против полного
+перебора рецептов - того, что делает GROUP BY по RecipeIngredient.
+"""
+import random
+import statistics
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from api.recipe_match_index import build_postings, match_postings
+
+
+MatchResult = namedtuple(
+    'MatchResult',
+    ('pantry', 'missing', 'matches', 'index_p50_ms', 'index_p95_ms',
+     'scan_p50_ms')
+)
+
+
+def catalog(recipes, ingredients, seed=0):
+    """
+    (recipe_id, frozenset продуктов) по возрастанию id: в рецепте от 3
+    до 12 продуктов, популярность продуктов убывает как 1 / ранг.
+    """
+    rng = random.Random(seed)
+    population = range(1, ingredients + 1)
+    cum_weights = []
+    total = 0
+    for rank in population:
+        total += 1 / rank
+        cum_weights.append(total)
+    for recipe_id in range(1, recipes + 1):
+        size = rng.randint(3, 12)
+        ingredient_ids = set()
+        while len(ingredient_ids) < size:
+            ingredient_ids.update(rng.choices(
+                population, cum_weights=cum_weights,
+                k=size - len(ingredient_ids)
+            ))
+        yield recipe_id, frozenset(ingredient_ids)
+
+
+def build(recipes, ingredients):
+    """
+    Индекс, время генерации каталога вместе с построением (с) и память
+    массивов и словарей индекса (МБ).
+    """
+    started = time.perf_counter()
+    postings = build_postings(catalog(recipes, ingredients))
+    elapsed = time.perf_counter() - started
+    memory = sys.getsizeof(postings) + sum(
+        sys.getsizeof(by_size) + sum(map(sys.getsizeof, by_size.values()))
+        for by_size in postings.values()
+    )
+    return postings, round(elapsed, 1), round(memory / 2 ** 20, 1)
+
+
+def forward_index(recipes, ingredients):
+    """Продукты рецептов подряд в одном массиве и смещения рецептов."""
+    offsets, flat = array('I', [0]), array('I')
+    for _, ingredient_ids in catalog(recipes, ingredients):
+        flat.extend(ingredient_ids)
+        offsets.append(len(flat))
+    return offsets, flat
+
+
+def scan(forward, pantry, max_missing):
+    """Полный перебор рецептов: найдено и не хватает для каждого."""
+    offsets, flat = forward
+    matches = []
+    for index in range(len(offsets) - 1):
+        ingredient_ids = flat[offsets[index]:offsets[index + 1]]
+        found = len(pantry.intersection(ingredient_ids))
+        missing = len(ingredient_ids) - found
+        if found and missing <= max_missing:
+            matches.append((index + 1, found, missing))
+    return matches
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def measure(postings, forward, ingredients, pantry_size, max_missing,
+            repeat, scan_repeat, seed=0):
+    """
+    Время подбора для repeat случайных наборов продуктов: продукты
+    набора берутся из самых популярных, как в реальном холодильнике.
+    """
+    rng = random.Random(seed)
+    popular = range(1, min(ingredients, 200) + 1)
+    pantries = [
+        frozenset(rng.sample(popular, pantry_size)) for _ in range(repeat)
+    ]
+    timings, matches = [], 0
+    for pantry in pantries:
+        started = time.perf_counter()
+        matches += len(match_postings(postings, {}, pantry, max_missing))
+        timings.append((time.perf_counter() - started) * 1000)
+    scan_timings = []
+    for pantry in pantries[:scan_repeat]:
+        started = time.perf_counter()
+        scan(forward, pantry, max_missing)
+        scan_timings.append((time.perf_counter() - started) * 1000)
+    return MatchResult(
+        pantry_size, max_missing, matches // repeat,
+        round(statistics.median(timings), 1),
+        round(percentile(timings, 0.95), 1),
+        round(statistics.median(scan_timings), 1) if scan_timings else None
+    )
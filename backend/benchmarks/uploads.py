@@ -0,0 +1,96 @@
+"""
+Пиковая память (RSS) на одну загрузку изображения в base64:
+Base64ImageField из drf_extra_fields против потокового поля API.
+"""
+import base64
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from collections import namedtuple
+
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+
+from api.fields import StreamingBase64ImageField
+
+
+FIELDS = {
+    'drf_extra_fields': Base64ImageField,
+    'streaming': StreamingBase64ImageField,
+}
+CHUNK_SIZE = 64 * 1024
+
+UploadResult = namedtuple(
+    'UploadResult', ('field', 'peak_rss_mb', 'p50_ms')
+)
+
+
+def request_body(size):
+    """JSON-тело запроса с PNG из шума примерно на size байт."""
+    side = int((size / 3) ** 0.5)
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return json.dumps(
+        {'image': f'data:image/png;base64,{encoded}'}
+    ).encode()
+
+
+def memory_status():
+    """Текущий и пиковый RSS процесса, байт (Linux /proc)."""
+    values = {}
+    with open('/proc/self/status') as status:
+        for line in status:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                values[key] = int(value.split()[0]) * 1024
+    return values['VmRSS'], values['VmHWM']
+
+
+def upload(field_class, body):
+    """
+    Разбор тела, проверка поля и запись файла «в хранилище» кусками -
+    то же, что делает запрос на создание рецепта до обращения к БД.
+    """
+    data = json.loads(body)
+    file = field_class().run_validation(data.pop('image'))
+    for _ in file.chunks(CHUNK_SIZE):
+        pass
+
+
+def measure_once(field_class, body, connection):
+    # Сброс пикового RSS, чтобы мерить только эту загрузку.
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+    rss_before, _ = memory_status()
+    started = time.perf_counter()
+    upload(field_class, body)
+    elapsed = time.perf_counter() - started
+    _, peak = memory_status()
+    connection.send((peak - rss_before, elapsed))
+    connection.close()
+
+
+def measure(name, body, repeat):
+    """Каждая загрузка - в отдельном fork-процессе с чистым пиком RSS."""
+    context = multiprocessing.get_context('fork')
+    peaks, timings = [], []
+    for _ in range(repeat):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=measure_once, args=(FIELDS[name], body, sender)
+        )
+        process.start()
+        peak, elapsed = receiver.recv()
+        process.join()
+        peaks.append(peak)
+        timings.append(elapsed)
+    return UploadResult(
+        name,
+        round(statistics.median(peaks) / 2 ** 20, 1),
+        round(statistics.median(timings) * 1000, 1),
+    )
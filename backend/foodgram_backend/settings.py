@@ -96,9 +96,64 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 # ------------------------------------
+# Поиск продуктов по префиксу из индекса в памяти процесса
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 0)) or None
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+# Подбор рецептов по продуктам (api/recipe_match_index.py): полная
+# перестройка индекса раз в TTL секунд или при переполнении overlay
+RECIPE_MATCH_INDEX_TTL = int(os.getenv('RECIPE_MATCH_INDEX_TTL', 3600))
+RECIPE_MATCH_OVERLAY_LIMIT = int(
+    os.getenv('RECIPE_MATCH_OVERLAY_LIMIT', 10000)
+)
+RECIPE_MATCH_SYNC_MARGIN = int(os.getenv('RECIPE_MATCH_SYNC_MARGIN', 60))
+RECIPE_MATCH_BUILD_CHUNK_SIZE = 10000
+RECIPE_MATCH_MAX_MISSING = int(os.getenv('RECIPE_MATCH_MAX_MISSING', 3))
+# Ленты подписок (FeedEntry): длина ленты, порог подписчиков, после
+# которого рецепты автора не рассылаются, и размер пачки рассылки
+FEED_INBOX_LENGTH = int(os.getenv('FEED_INBOX_LENGTH', 500))
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000)
+)
+FEED_FANOUT_BATCH_SIZE = int(os.getenv('FEED_FANOUT_BATCH_SIZE', 500))
+# Похожие рецепты (compute_related_recipes): число соседей, минимум
+# общих добавлений и порог «всеядных» пользователей
+RELATED_RECIPES_COUNT = int(os.getenv('RELATED_RECIPES_COUNT', 10))
+RELATED_RECIPES_MIN_SUPPORT = int(
+    os.getenv('RELATED_RECIPES_MIN_SUPPORT', 2)
+)
+RELATED_RECIPES_MAX_USER_ITEMS = int(
+    os.getenv('RELATED_RECIPES_MAX_USER_ITEMS', 1000)
+)
+# ------------------------------------
+# Кэш: locmem по умолчанию, CACHE_BACKEND=file или redis - по выбору
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[os.getenv('CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+# Кэш ответов ленты и рецептов для анонимов (api/response_cache.py)
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600))
+# Кэш не зависящих от пользователя фрагментов RecipeReadSerializer
+RECIPE_FRAGMENT_CACHE_ALIAS = 'default'
+RECIPE_FRAGMENT_TIMEOUT = int(os.getenv('RECIPE_FRAGMENT_TIMEOUT', 86400))
+# ------------------------------------
 # Для работы с аватарками
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Загрузка изображений в base64 (api/fields.py): лимиты и порог,
+# после которого декодированный файл уходит из памяти на диск
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10485760))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40000000))
+IMAGE_SPOOL_MAX_SIZE = int(os.getenv('IMAGE_SPOOL_MAX_SIZE', 1048576))
+# Потоки для построения уменьшенных копий изображений (recipes/images.py)
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
 # ------------------------------------
 
 ROOT_URLCONF = 'foodgram_backend.urls'
@@ -3,14 +3,16 @@ from django.contrib import admin
 from django.contrib.auth.models import Group
 from django.db.models import F, Value, CharField
 from django.db.models.functions import Concat
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 
 from .models import (
-    FavoriteRecipes, Ingredient,
+    FavoriteRecipes, Ingredient, ModelVersion,
     Recipe, RecipeIngredient,
-    ShoppingList, Subscriptions,
+    ShoppingList, ShoppingListTotal, Subscriptions,
     Tag, User
 )
+from .search import update_search_index
 
 
 class RecipeIngredientInlineForm(forms.ModelForm):
@@ -85,6 +87,31 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('tags', 'author', CookingTimeFilter)
     inlines = (RecipeIngredientInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Продукты и теги сохраняются после рецепта: обновляем
+        # updated_at, чтобы сбросить кэш фрагментов и ETag рецепта.
+        Recipe.objects.filter(pk=form.instance.pk).update(
+            updated_at=timezone.now()
+        )
+        update_search_index((form.instance.pk,))
+        # Продукты из инлайна меняются без пересчёта дельт: итоги
+        # корзин с этим рецептом пересчитываются заново.
+        ShoppingListTotal.recompute(
+            ShoppingList.objects.filter(recipe=form.instance).values_list(
+                'author_id', flat=True
+            )
+        )
+        ModelVersion.bump(Recipe)
+
+    def delete_model(self, request, recipe):
+        super().delete_model(request, recipe)
+        ModelVersion.bump(Recipe)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        ModelVersion.bump(Recipe)
+
     @admin.display(description='Теги')
     def get_tags(self, recipe):
         return mark_safe('<br>'.join(tag.name for tag in recipe.tags.all()))
@@ -106,9 +133,9 @@ class RecipeAdmin(admin.ModelAdmin):
             else ''
         )
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def in_favorites(self, recipe):
-        return recipe.favoriterecipes.count()
+        return recipe.favorites_count
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,113 @@
+"""
+Конвейер обработки изображений: уменьшенные копии (thumbnail, card,
+full) в WebP и JPEG по детерминированным путям от имени оригинала.
+Оригиналы называются SHA-256 содержимого, поэтому пути копий тоже
+адресуются содержимым; одинаковые файлы в разных каталогах загрузки
+получают отдельные копии, чтобы gc_media удалял их независимо.
+Копии строятся в пуле потоков после коммита транзакции, вне потока
+запроса.
+"""
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+VARIANTS_DIR = 'variants'
+# Путь копии детерминирован: повторная запись (в том числе параллельная)
+# перезаписывает тот же файл, а не создаёт file_XXXXXXX.webp.
+variant_storage = FileSystemStorage(allow_overwrite=True)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix='image-variants'
+)
+
+
+def variants_dir(name):
+    return f'{VARIANTS_DIR}/{PurePosixPath(name).with_suffix("")}'
+
+
+def variant_name(name, variant, image_format):
+    return f'{variants_dir(name)}/{variant}.{EXTENSIONS[image_format]}'
+
+
+def variant_names(name):
+    return {
+        variant: {
+            image_format: variant_name(name, variant, image_format)
+            for image_format in FORMATS
+        }
+        for variant in VARIANTS
+    }
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail(size, Image.Resampling.LANCZOS)
+    pil_format, options = FORMATS[image_format]
+    if pil_format == 'JPEG' and variant.mode != 'RGB':
+        background = Image.new('RGB', variant.size, 'white')
+        variant = variant.convert('RGBA')
+        background.paste(variant, mask=variant.getchannel('A'))
+        variant = background
+    buffer = io.BytesIO()
+    variant.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_variants(name, force=False):
+    """
+    Строит недостающие копии изображения name из default_storage.
+    Возвращает число созданных файлов.
+    """
+    pending = {
+        path: (variant, image_format)
+        for variant, paths in variant_names(name).items()
+        for image_format, path in paths.items()
+        if force or not variant_storage.exists(path)
+    }
+    if not pending:
+        return 0
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for path, (variant, image_format) in pending.items():
+        variant_storage.save(path, ContentFile(
+            render_variant(image, VARIANTS[variant], image_format)
+        ))
+    return len(pending)
+
+
+def _generate_safely(name):
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception('Не удалось построить копии изображения %s', name)
+
+
+def schedule_variants(name):
+    """Ставит построение копий в пул после коммита текущей транзакции."""
+    if name:
+        transaction.on_commit(lambda: _executor.submit(_generate_safely, name))
@@ -1,31 +1,110 @@
 import json
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+
+from recipes.models import ModelVersion
+
+
+def read_json_lines(file):
+    """
+    Построчно разбирает JSON Lines (NDJSON), не читая файл целиком.
+    Возвращает пары (номер строки, объект); пустые строки пропускаются.
+    """
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Строка {line_number}: {error}')
 
 
 class ImportDataCommand(BaseCommand):
-    """Базовый класс для импорта данных."""
+    """
+    Базовый класс для импорта данных: upsert по уникальному ключу.
+    Файл сравнивается с одним снимком таблицы; записываются только
+    новые и изменившиеся объекты, так что повторный импорт ничего
+    не меняет.
+    """
     help = ''
     model = None
     json_file_path = ''
+    # Уникальный ключ (поля ограничения) и поля, обновляемые по ключу.
+    unique_fields = ()
+    update_fields = ()
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=self.json_file_path)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать изменения, не записывая их'
+        )
+
+    def diff(self, data):
+        """Делит объекты файла на новые, изменившиеся и без изменений."""
+        fields = (*self.unique_fields, *self.update_fields)
+        key_size = len(self.unique_fields)
+        snapshot = {
+            row[:key_size]: row[key_size:]
+            for row in self.model.objects.values_list(*fields).iterator()
+        }
+        items = {
+            tuple(item[field] for field in self.unique_fields): item
+            for item in data
+        }
+        inserted, updated, unchanged = [], [], 0
+        for key, item in items.items():
+            if key not in snapshot:
+                inserted.append(item)
+            elif snapshot[key] != tuple(
+                item[field] for field in self.update_fields
+            ):
+                updated.append(item)
+            else:
+                unchanged += 1
+        return inserted, updated, unchanged
+
+    def handle(self, *args, **options):
+        path = options['path']
         try:
-            with open(self.json_file_path, 'r', encoding='utf-8') as file:
+            with open(path, 'r', encoding='utf-8') as file:
                 data = json.load(file)
-            objects = [
-                self.model(**item)
-                for item in data
-            ]
-            self.model.objects.bulk_create(objects, ignore_conflicts=True)
-            self.stdout.write(self.style.SUCCESS(
-                f'{self.model._meta.verbose_name_plural} '
-                'успешно импортированы. '
-                f'Добавлено: {len(objects)}.'
-            ))
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(
+            inserted, updated, unchanged = self.diff(data)
+            if not options['dry_run'] and (inserted or updated):
+                self.save(
+                    [self.model(**item) for item in (*inserted, *updated)],
+                    options['batch_size']
+                )
+        except (OSError, ValueError, KeyError, TypeError,
+                DatabaseError) as error:
+            raise CommandError(
                 'Ошибка при импорте данных в модель '
                 f'"{self.model._meta.object_name}" '
-                f'из файла "{self.json_file_path}": {e}'
-            ))
+                f'из файла "{path}": {error}'
+            ) from error
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.model._meta.verbose_name_plural} '
+            + ('проверены (без записи). ' if options['dry_run']
+               else 'успешно импортированы. ')
+            + f'Добавлено: {len(inserted)}, обновлено: {len(updated)}, '
+            f'без изменений: {unchanged}.'
+        ))
+
+    def save(self, objects, batch_size):
+        """Записывает все пачки одной транзакцией."""
+        with transaction.atomic():
+            if self.update_fields:
+                self.model.objects.bulk_create(
+                    objects,
+                    update_conflicts=True,
+                    unique_fields=self.unique_fields,
+                    update_fields=self.update_fields,
+                    batch_size=batch_size
+                )
+            else:
+                self.model.objects.bulk_create(
+                    objects, ignore_conflicts=True, batch_size=batch_size
+                )
+            ModelVersion.bump(self.model)
@@ -0,0 +1,142 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks.api import (
+    build_cases, query_count_mismatches, run_case, uncovered_routes
+)
+from benchmarks.database import benchmark_database
+from benchmarks.generator import generate
+
+
+BASELINE_FILE = 'benchmarks/baseline.json'
+BYTES_TOLERANCE = 1.05
+# Задержки ниже порога не сравниваются: на них доминирует шум.
+LATENCY_FLOOR_MS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все эндпоинты API на синтетических данных в SQLite '
+        'и сравнивает число запросов, задержку и объём ответов '
+        f'с базовой линией из {BASELINE_FILE}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recipes', type=int, default=600)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--favorites', type=int, default=10)
+        parser.add_argument('--carts', type=int, default=5)
+        parser.add_argument('--subscriptions', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--baseline', default=BASELINE_FILE)
+        parser.add_argument(
+            '--latency-tolerance', type=float, default=3.0,
+            help='Допустимое превышение p95 относительно базовой линии, раз'
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Записать результаты как новую базовую линию'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                'Бенчмарк выполняется на SQLite: запустите с SQLITE=1.'
+            )
+        with benchmark_database():
+            results = self.run_benchmark(options)
+        self.report(results)
+        mismatches = query_count_mismatches(results)
+        if mismatches:
+            raise CommandError(
+                'Число запросов ленты зависит от размера страницы:\n'
+                + '\n'.join(mismatches)
+            )
+        if options['update_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(
+                    {result.name: result._asdict() for result in results},
+                    file, ensure_ascii=False, indent=2
+                )
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовая линия записана в {options["baseline"]}.'
+            ))
+            return
+        self.compare(results, options)
+
+    def run_benchmark(self, options):
+        users = generate(
+            users=options['users'],
+            recipes=options['recipes'],
+            ingredients=options['ingredients'],
+            favorites=options['favorites'],
+            carts=options['carts'],
+            subscriptions=options['subscriptions'],
+        )
+        cases, clients = build_cases(users)
+        uncovered = uncovered_routes(cases)
+        if uncovered:
+            raise CommandError(
+                f'Нет сценариев для маршрутов: {", ".join(uncovered)}'
+            )
+        return [
+            run_case(case, clients[case.client], options['repeat'])
+            for case in cases
+        ]
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"Сценарий":<45} {"код":>4} {"запросы":>8} '
+            f'{"p50, мс":>9} {"p95, мс":>9} {"байт":>9}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result.name:<45} {result.status:>4} {result.queries:>8} '
+                f'{result.p50_ms:>9} {result.p95_ms:>9} {result.bytes:>9}'
+            )
+
+    def compare(self, results, options):
+        try:
+            with open(options['baseline'], 'r', encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            raise CommandError(
+                f'Нет базовой линии {options["baseline"]}: '
+                'запустите с --update-baseline.'
+            )
+        regressions = []
+        for result in results:
+            expected = baseline.get(result.name)
+            if expected is None:
+                regressions.append(f'{result.name}: нет в базовой линии')
+                continue
+            if result.queries > expected['queries']:
+                regressions.append(
+                    f'{result.name}: запросов {result.queries} '
+                    f'> {expected["queries"]}'
+                )
+            if result.p95_ms > max(
+                expected['p95_ms'] * options['latency_tolerance'],
+                LATENCY_FLOOR_MS
+            ):
+                regressions.append(
+                    f'{result.name}: p95 {result.p95_ms} мс '
+                    f'> {expected["p95_ms"]} мс '
+                    f'x {options["latency_tolerance"]}'
+                )
+            if result.bytes > expected['bytes'] * BYTES_TOLERANCE:
+                regressions.append(
+                    f'{result.name}: ответ {result.bytes} байт '
+                    f'> {expected["bytes"]} байт'
+                )
+        if regressions:
+            raise CommandError(
+                'Превышена базовая линия:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Все эндпоинты укладываются в базовую линию.'
+        ))
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.uploads import FIELDS, measure, request_body
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пиковую память (RSS) и время на одну загрузку '
+        'изображения в base64 для Base64ImageField и потокового поля API'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size-mb', type=float, default=10,
+            help='Размер изображения, МБ'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if not sys.platform.startswith('linux'):
+            raise CommandError('Замер RSS использует /proc и требует Linux.')
+        body = request_body(int(options['size_mb'] * 2 ** 20))
+        self.stdout.write(f'Тело запроса: {len(body) / 2 ** 20:.1f} МБ')
+        self.stdout.write(
+            f'{"Поле":<20} {"пик RSS, МБ":>12} {"p50, мс":>9}'
+        )
+        results = [
+            measure(name, body, options['repeat']) for name in FIELDS
+        ]
+        for result in results:
+            self.stdout.write(
+                f'{result.field:<20} {result.peak_rss_mb:>12} '
+                f'{result.p50_ms:>9}'
+            )
+        before, after = results
+        self.stdout.write(self.style.SUCCESS(
+            f'Пиковая память на загрузку: {before.peak_rss_mb} -> '
+            f'{after.peak_rss_mb} МБ.'
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from benchmarks.matching import build, forward_index, measure
+
+
+class Command(BaseCommand):
+    help = (
+        'Время подбора рецептов по продуктам («что приготовить») на '
+        'синтетическом каталоге: индекс в памяти против полного перебора'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--scan-repeat', type=int, default=3,
+            help='Замеров полного перебора (0 - не сравнивать)'
+        )
+
+    def handle(self, *args, **options):
+        recipes, ingredients = options['recipes'], options['ingredients']
+        postings, elapsed, memory = build(recipes, ingredients)
+        self.stdout.write(
+            f'Индекс на {recipes} рецептов: генерация и построение '
+            f'{elapsed} с, память {memory} МБ'
+        )
+        forward = (
+            forward_index(recipes, ingredients)
+            if options['scan_repeat'] else None
+        )
+        self.stdout.write(
+            f'{"Продуктов":>9} {"missing":>8} {"найдено":>9} '
+            f'{"p50, мс":>9} {"p95, мс":>9} {"перебор p50, мс":>16}'
+        )
+        for pantry_size in (5, 10, 20):
+            for max_missing in (0, 1, 2):
+                result = measure(
+                    postings, forward, ingredients, pantry_size, max_missing,
+                    options['repeat'],
+                    options['scan_repeat'] if forward else 0
+                )
+                self.stdout.write(
+                    f'{result.pantry:>9} {result.missing:>8} '
+                    f'{result.matches:>9} {result.index_p50_ms:>9} '
+                    f'{result.index_p95_ms:>9} '
+                    f'{result.scan_p50_ms or "-":>16}'
+                )
+        self.stdout.write(self.style.SUCCESS('Готово.'))
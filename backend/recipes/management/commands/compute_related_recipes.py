@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.models import ModelVersion, Recipe, RelatedRecipe
+from recipes.related import RELATIONS, recipe_weights, update_related
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты по совместному добавлению в '
+        'избранное и списки покупок. Без --full - только рецепты, '
+        'избранное и корзины которых менялись после прошлого запуска, '
+        'рецепты, у которых они в соседях, и рецепты с общими '
+        'пользователями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты'
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--top', type=int, default=settings.RELATED_RECIPES_COUNT
+        )
+        parser.add_argument(
+            '--min-support', type=int,
+            default=settings.RELATED_RECIPES_MIN_SUPPORT,
+            help='Минимум общих добавлений для пары рецептов'
+        )
+        parser.add_argument(
+            '--max-user-items', type=int,
+            default=settings.RELATED_RECIPES_MAX_USER_ITEMS,
+            help='Не учитывать пользователей с большим числом рецептов'
+        )
+
+    def handle(self, *args, **options):
+        # Изменения после started попадут в следующий запуск.
+        started = timezone.now()
+        last_run = ModelVersion.current(RelatedRecipe)
+        if options['full'] or not last_run.version:
+            recipes = Recipe.objects.all()
+        else:
+            changed_since = last_run.updated_at
+            changed = Q(relations_changed_at__gte=changed_since) | Q(
+                id__in=RelatedRecipe.objects.filter(
+                    related__relations_changed_at__gte=changed_since
+                ).values('recipe_id')
+            )
+            # Рецепты с общими пользователями могут получить изменённый
+            # рецепт в соседи, даже если раньше его там не было.
+            for model in RELATIONS:
+                changed |= Q(id__in=model.objects.filter(
+                    author__in=model.objects.filter(
+                        recipe__relations_changed_at__gte=changed_since
+                    ).values('author_id')
+                ).values('recipe_id'))
+            recipes = Recipe.objects.filter(changed)
+        recipe_ids = list(
+            recipes.order_by('id').values_list('id', flat=True)
+        )
+        weights = recipe_weights(options['chunk_size'])
+        rows = 0
+        for start in range(0, len(recipe_ids), options['chunk_size']):
+            rows += update_related(
+                recipe_ids[start:start + options['chunk_size']], weights,
+                options['top'], options['min_support'],
+                options['max_user_items']
+            )
+        ModelVersion.bump(RelatedRecipe)
+        ModelVersion.objects.filter(
+            label=RelatedRecipe._meta.label_lower
+        ).update(updated_at=started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {len(recipe_ids)}, '
+            f'похожих рецептов: {rows}.'
+        ))
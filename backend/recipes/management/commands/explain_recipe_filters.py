@@ -0,0 +1,99 @@
+import re
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.views import RecipeViewSet, recipe_feed_queryset
+from benchmarks.database import benchmark_database
+from benchmarks.generator import generate
+from recipes.models import Tag
+
+
+PAGE_SIZE = 6
+# Полный просмотр таблицы в плане PostgreSQL и SQLite.
+SEQ_SCAN = re.compile(
+    r'Seq Scan on (?P<pg>\w+)|\bSCAN (?P<sqlite>\w+)(?! USING)(?:\s|$)'
+)
+LARGE_TABLES = (
+    'recipes_recipe', 'recipes_recipeingredient',
+    'recipes_favoriterecipes', 'recipes_shoppinglist',
+    'recipes_recipe_tags',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует данные во временной БД и выводит EXPLAIN запросов '
+        'ленты рецептов для фильтров RecipeFilter'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=1_000_000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--fail-on-seq-scan', action='store_true',
+            help='Завершиться с ошибкой при полном просмотре '
+                 'больших таблиц'
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.stdout.write('Генерация данных...')
+            users = generate(
+                users=options['users'],
+                recipes=options['recipes'],
+                ingredients=options['ingredients'],
+            )
+            seq_scans = self.explain_all(users)
+        if seq_scans and options['fail_on_seq_scan']:
+            raise CommandError(
+                'Полный просмотр таблиц: ' + ', '.join(seq_scans)
+            )
+
+    def scenarios(self, users):
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        return (
+            ('Лента', users[0], {}),
+            ('Лента (аноним)', AnonymousUser(), {}),
+            ('Автор', users[0], {'author': users[1].id}),
+            ('Теги', users[0], {'tags': slugs}),
+            ('Избранное', users[0], {'is_favorited': 1}),
+            ('Корзина', users[0], {'is_in_shopping_cart': 1}),
+            ('Автор и теги', users[0],
+             {'author': users[1].id, 'tags': slugs}),
+            ('Избранное и теги', users[0],
+             {'is_favorited': 1, 'tags': slugs}),
+            ('Популярные', users[0], {'ordering': 'popular'}),
+        )
+
+    def explain_all(self, users):
+        factory = RequestFactory()
+        seq_scans = []
+        for name, user, params in self.scenarios(users):
+            request = factory.get('/api/recipes/', params)
+            request.user = user
+            recipes = RecipeFilter(
+                request.GET,
+                queryset=recipe_feed_queryset(user, RecipeViewSet.queryset),
+                request=request
+            ).qs
+            for label, queryset in (
+                ('страница', recipes[:PAGE_SIZE]),
+                ('COUNT', recipes.order_by().values('id')),
+            ):
+                plan = queryset.explain()
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'{name} {dict(params)} - {label}'
+                ))
+                self.stdout.write(plan)
+                for match in SEQ_SCAN.finditer(plan):
+                    table = match.group('pg') or match.group('sqlite')
+                    if table in LARGE_TABLES:
+                        seq_scans.append(f'{name} ({label}): {table}')
+                        self.stdout.write(self.style.WARNING(
+                            f'Полный просмотр таблицы {table}'
+                        ))
+        return seq_scans
@@ -0,0 +1,67 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково выгружает рецепты в JSON Lines: по рецепту на строку, '
+        'с автором (email), тегами (названия) и продуктами '
+        '(название, единица, количество)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSON Lines, - для stdout')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        ).order_by('id')
+        file = (
+            sys.stdout if options['path'] == '-'
+            else open(options['path'], 'w', encoding='utf-8')
+        )
+        exported = 0
+        try:
+            for recipe in recipes.iterator(chunk_size=options['batch_size']):
+                file.write(json.dumps({
+                    'author': recipe.author.email,
+                    'name': recipe.name,
+                    'text': recipe.text,
+                    'cooking_time': recipe.cooking_time,
+                    'image': recipe.image.name,
+                    'tags': [tag.name for tag in recipe.tags.all()],
+                    'ingredients': [
+                        {
+                            'name': row.ingredient.name,
+                            'measurement_unit': (
+                                row.ingredient.measurement_unit
+                            ),
+                            'amount': row.amount,
+                        }
+                        for row in recipe.recipe_ingredients.all()
+                    ],
+                }, ensure_ascii=False) + '\n')
+                exported += 1
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        # При выгрузке в stdout отчёт не должен смешиваться с данными.
+        report = self.stderr if options['path'] == '-' else self.stdout
+        report.write(self.style.SUCCESS(
+            f'Рецепты выгружены: {exported}.'
+        ))
@@ -0,0 +1,129 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.images import variant_names, variant_storage, variants_dir
+from recipes.models import StoredFile
+from recipes.signals import MEDIA_FIELDS
+
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет пачками файлы хранилища, на которые не осталось ссылок '
+        'из рецептов и аватаров, вместе с их уменьшенными копиями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--grace-minutes', type=int, default=60,
+            help='Не трогать файлы, потерявшие ссылки позже этого срока'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать ссылки по базе и учесть файлы на диске'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения ссылок и файлы к удалению'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.rebuild(options['batch_size'], options['dry_run'])
+        orphans = StoredFile.objects.filter(
+            refcount=0,
+            updated_at__lt=timezone.now() - timedelta(
+                minutes=options['grace_minutes']
+            )
+        )
+        if options['dry_run']:
+            self.stdout.write(
+                f'Файлов без ссылок к удалению: {orphans.count()}.'
+            )
+            return
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                names = list(
+                    orphans.select_for_update(skip_locked=True).order_by(
+                        'id'
+                    ).values_list('name', flat=True)[:options['batch_size']]
+                )
+                if not names:
+                    break
+                StoredFile.objects.filter(name__in=names, refcount=0).delete()
+            # Сверка после коммита: загрузка того же файла могла создать
+            # строку заново, пока удаление ждало коммита.
+            names = set(names) - set(StoredFile.objects.filter(
+                name__in=names
+            ).values_list('name', flat=True))
+            for name in names:
+                self.delete_file(name)
+            deleted += len(names)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов без ссылок: {deleted}.'
+        ))
+
+    def rebuild(self, batch_size, dry_run=False):
+        references = Counter()
+        on_disk = set()
+        for model, field in MEDIA_FIELDS.items():
+            references.update(
+                model.objects.exclude(**{field: ''}).exclude(
+                    **{f'{field}__isnull': True}
+                ).values_list(field, flat=True).iterator()
+            )
+            storage = model._meta.get_field(field).storage
+            directory = model._meta.get_field(field).upload_to
+            if storage.exists(directory):
+                on_disk.update(
+                    os.path.join(directory, file_name).replace('\\', '/')
+                    for file_name in storage.listdir(directory)[1]
+                )
+        with transaction.atomic():
+            stored = {
+                stored_file.name: stored_file
+                for stored_file in StoredFile.objects.select_for_update()
+            }
+            changed = []
+            for name, stored_file in stored.items():
+                if stored_file.refcount != references[name]:
+                    stored_file.refcount = references[name]
+                    changed.append(stored_file)
+            created = [
+                StoredFile(name=name, refcount=references[name])
+                for name in (references.keys() | on_disk) - stored.keys()
+            ]
+            if dry_run:
+                self.stdout.write(
+                    f'Ссылки расходятся: исправить {len(changed)}, '
+                    f'добавить {len(created)}.'
+                )
+                return
+            StoredFile.objects.bulk_update(
+                changed, ('refcount',), batch_size=batch_size
+            )
+            StoredFile.objects.bulk_create(created, batch_size=batch_size)
+        self.stdout.write(
+            f'Ссылки пересчитаны: исправлено {len(changed)}, '
+            f'добавлено {len(created)}.'
+        )
+
+    def delete_file(self, name):
+        default_storage.delete(name)
+        for paths in variant_names(name).values():
+            for path in paths.values():
+                variant_storage.delete(path)
+        try:
+            os.rmdir(variant_storage.path(variants_dir(name)))
+        except (NotImplementedError, OSError):
+            pass
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит недостающие уменьшенные копии изображений рецептов '
+        'и аватаров пользователей'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить копии, даже если они уже есть'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_VARIANT_WORKERS
+        )
+
+    def handle(self, *args, **options):
+        names = {
+            *Recipe.objects.exclude(image='').values_list(
+                'image', flat=True
+            ).iterator(),
+            *User.objects.exclude(avatar='').exclude(
+                avatar__isnull=True
+            ).values_list('avatar', flat=True).iterator(),
+        }
+        created = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                name: executor.submit(generate_variants, name,
+                                      options['force'])
+                for name in sorted(names)
+            }
+            for name, future in futures.items():
+                try:
+                    created += future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(names)}, создано копий: {created}, '
+            f'ошибок: {failed}.'
+        ))
@@ -6,3 +6,4 @@ class Command(ImportDataCommand):
     help = 'Импортирует ингредиенты из data/ingredients.json'
     model = Ingredient
     json_file_path = 'data/ingredients.json'
+    unique_fields = ('name', 'measurement_unit')
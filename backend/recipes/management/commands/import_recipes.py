@@ -0,0 +1,120 @@
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from recipes.models import (
+    Ingredient, ModelVersion, Recipe, RecipeIngredient, StoredFile, Tag, User
+)
+from recipes.search import update_search_index
+from .base import read_json_lines
+
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково импортирует рецепты из JSON Lines (формат '
+        'export_recipes) пачками, каждая пачка - в своей транзакции. '
+        'Авторы, теги и продукты должны уже быть в базе; файлы '
+        'изображений переносятся отдельно, копии строит '
+        'generate_image_variants'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSON Lines, - для stdin')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.authors = dict(User.objects.values_list('email', 'id'))
+        self.tags = dict(Tag.objects.values_list('name', 'id'))
+        self.ingredients = {
+            (name, measurement_unit): ingredient_id
+            for ingredient_id, name, measurement_unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        }
+        imported = 0
+        file = (
+            sys.stdin if options['path'] == '-'
+            else open(options['path'], 'r', encoding='utf-8')
+        )
+        try:
+            lines = read_json_lines(file)
+            while batch := list(islice(lines, options['batch_size'])):
+                self.import_batch(batch)
+                imported += len(batch)
+                self.stdout.write(f'Импортировано рецептов: {imported}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+            if imported:
+                ModelVersion.bump(Recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецепты успешно импортированы. Добавлено: {imported}.'
+        ))
+
+    def build(self, line_number, item):
+        try:
+            recipe = Recipe(
+                author_id=self.authors[item['author']],
+                name=item['name'],
+                text=item['text'],
+                cooking_time=int(item['cooking_time']),
+                image=item['image'],
+            )
+            ingredients = {
+                self.ingredients[
+                    (ingredient['name'], ingredient['measurement_unit'])
+                ]: int(ingredient['amount'])
+                for ingredient in item['ingredients']
+            }
+            tags = {self.tags[name] for name in item['tags']}
+        except KeyError as error:
+            raise CommandError(
+                f'Строка {line_number}: нет поля или неизвестное '
+                f'значение {error}'
+            )
+        except (TypeError, ValueError) as error:
+            raise CommandError(f'Строка {line_number}: {error}')
+        if not ingredients or not tags:
+            raise CommandError(
+                f'Строка {line_number}: у рецепта нет продуктов или тегов'
+            )
+        if recipe.cooking_time < 1 or min(ingredients.values()) < 1:
+            raise CommandError(
+                f'Строка {line_number}: время и количество должны быть '
+                'положительными'
+            )
+        return recipe, ingredients, tags
+
+    def import_batch(self, batch):
+        rows = [self.build(line_number, item) for line_number, item in batch]
+        recipes = [recipe for recipe, _, _ in rows]
+        try:
+            with transaction.atomic():
+                Recipe.objects.bulk_create(recipes)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(
+                        recipe_id=recipe.id, ingredient_id=ingredient_id,
+                        amount=amount
+                    )
+                    for recipe, ingredients, _ in rows
+                    for ingredient_id, amount in ingredients.items()
+                )
+                Recipe.tags.through.objects.bulk_create(
+                    Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+                    for recipe, _, tags in rows
+                    for tag_id in tags
+                )
+                StoredFile.change(
+                    acquired=(recipe.image.name for recipe in recipes)
+                )
+                update_search_index(recipe.id for recipe in recipes)
+        except IntegrityError as error:
+            raise CommandError(
+                f'Строки {batch[0][0]}-{batch[-1][0]}: {error}'
+            )
@@ -6,3 +6,5 @@ class Command(ImportDataCommand):
     help = 'Импортирует теги из data/tags.json'
     model = Tag
     json_file_path = 'data/tags.json'
+    unique_fields = ('slug',)
+    update_fields = ('name',)
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedEntry, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново раскладывает рецепты по лентам подписок (FeedEntry): '
+        'рецепты авторов с числом подписчиков не больше '
+        'FEED_FANOUT_MAX_FOLLOWERS рассылаются, остальные читаются '
+        'из подписок при запросе ленты'
+    )
+
+    def handle(self, *args, **options):
+        author_ids = Recipe.objects.order_by('author_id').values_list(
+            'author_id', flat=True
+        ).distinct()
+        delivered = pulled = 0
+        for author_id in author_ids.iterator():
+            with transaction.atomic():
+                followers = FeedEntry.fanout_followers(author_id)
+                recipes = Recipe.objects.filter(author_id=author_id)
+                recipes.update(fanned_out=followers is not None)
+                FeedEntry.objects.filter(recipe__author_id=author_id).delete()
+                if followers is None:
+                    pulled += 1
+                    continue
+                FeedEntry.deliver(followers, recipes.order_by(
+                    '-created_at', '-id'
+                ).values_list('id', 'created_at')[
+                    :settings.FEED_INBOX_LENGTH
+                ])
+                delivered += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Авторов с рассылкой: {delivered}, '
+            f'с чтением по подпискам: {pulled}.'
+        ))
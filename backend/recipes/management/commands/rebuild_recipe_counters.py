@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteRecipes, Recipe, ShoppingList
+
+
+BATCH_SIZE = 1000
+
+
+def counted(model):
+    """Фактическое число связей model с рецептом (для аннотаций)."""
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe'
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет и пересчитывает счётчики рецептов favorites_count и '
+        'in_carts_count по избранному и спискам покупок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счётчики, не изменяя их'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        counters = {
+            model.recipe_counter: counted(model)
+            for model in (FavoriteRecipes, ShoppingList)
+        }
+        mismatched = list(
+            Recipe.objects.alias(**{
+                f'actual_{field}': expression
+                for field, expression in counters.items()
+            }).exclude(**{
+                field: F(f'actual_{field}') for field in counters
+            }).values_list('id', flat=True).iterator()
+        )
+        if options['check']:
+            if mismatched:
+                raise CommandError(
+                    f'Расхождений в счётчиках рецептов: {len(mismatched)}.'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'Счётчики рецептов совпадают с избранным и корзинами.'
+            ))
+            return
+        batch_size = options['batch_size']
+        for start in range(0, len(mismatched), batch_size):
+            Recipe.objects.filter(
+                id__in=mismatched[start:start + batch_size]
+            ).update(**counters)
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики рецептов пересчитаны, исправлено: {len(mismatched)}.'
+        ))
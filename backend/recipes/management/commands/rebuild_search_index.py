@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import BATCH_SIZE, update_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает поисковые документы всех рецептов, например после '
+        'переименования продуктов или массовой загрузки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        ).iterator(chunk_size=options['batch_size'])
+        total = 0
+        batch = []
+        for recipe_id in recipe_ids:
+            batch.append(recipe_id)
+            if len(batch) == options['batch_size']:
+                total += self.update(batch)
+                batch = []
+        total += self.update(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые документы пересчитаны: {total}.'
+        ))
+
+    @staticmethod
+    def update(batch):
+        with transaction.atomic():
+            update_search_index(batch)
+        return len(batch)
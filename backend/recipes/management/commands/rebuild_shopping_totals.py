@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListTotal
+
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает итоги списков покупок (ShoppingListTotal) '
+        'по корзинам пользователей'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить итоги, не изменяя их'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        expected = ShoppingListTotal.from_carts()
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListTotal.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            ).iterator()
+        }
+        mismatches = sum(
+            expected.get(key) != actual.get(key)
+            for key in expected.keys() | actual.keys()
+        )
+        if options['check']:
+            if mismatches:
+                raise CommandError(
+                    f'Расхождений в итогах списков покупок: {mismatches}.'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'Итоги списков покупок совпадают с корзинами.'
+            ))
+            return
+        with transaction.atomic():
+            ShoppingListTotal.objects.all().delete()
+            ShoppingListTotal.objects.bulk_create(
+                (ShoppingListTotal(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    total_amount=total_amount
+                ) for (user_id, ingredient_id), total_amount
+                    in expected.items()),
+                batch_size=options['batch_size']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги списков покупок пересчитаны: {len(expected)} строк, '
+            f'исправлено расхождений: {mismatches}.'
+        ))
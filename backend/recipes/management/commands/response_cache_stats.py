@@ -0,0 +1,31 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from api.response_cache import HITS_KEY, MISSES_KEY, get_cache, stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Выводит попадания и промахи кэша ответов для анонимов. '
+        'Нужен общий для процессов кэш (CACHE_BACKEND=file или redis).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='Обнулить счётчики'
+        )
+
+    def handle(self, *args, **options):
+        if isinstance(get_cache(), LocMemCache):
+            raise CommandError(
+                'Счётчики locmem-кэша видны только внутри процесса '
+                'сервера: задайте CACHE_BACKEND=file или redis.'
+            )
+        hits, misses = stats()
+        total = hits + misses
+        self.stdout.write(
+            f'Попадания: {hits}, промахи: {misses}, '
+            f'доля попаданий: {hits / total if total else 0:.1%}'
+        )
+        if options['reset']:
+            get_cache().delete_many((HITS_KEY, MISSES_KEY))
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shopping_totals(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListTotal = apps.get_model('recipes', 'ShoppingListTotal')
+    ShoppingListTotal.objects.bulk_create(
+        (ShoppingListTotal(
+            user_id=row['recipe__shoppinglist__author'],
+            ingredient_id=row['ingredient'],
+            total_amount=row['total_amount'],
+        ) for row in RecipeIngredient.objects.filter(
+            recipe__shoppinglist__isnull=False
+        ).values(
+            'recipe__shoppinglist__author', 'ingredient'
+        ).annotate(total_amount=Sum('amount')).iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_alter_recipe_options_alter_recipeingredient_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_totals', to='recipes.ingredient', verbose_name='Продукт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+                'constraints': [models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_total')],
+            },
+        ),
+        migrations.RunPython(
+            fill_shopping_totals, migrations.RunPython.noop
+        ),
+    ]
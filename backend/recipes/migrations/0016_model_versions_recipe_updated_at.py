@@ -0,0 +1,49 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:35
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def create_model_versions(apps, schema_editor):
+    ModelVersion = apps.get_model('recipes', 'ModelVersion')
+    ModelVersion.objects.bulk_create(
+        ModelVersion(label=label)
+        for label in ('recipes.ingredient', 'recipes.tag', 'recipes.user')
+    )
+
+
+def set_updated_at(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=64, unique=True, verbose_name='Модель')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Версия модели',
+                'verbose_name_plural': 'Версии моделей',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(
+            create_model_versions, migrations.RunPython.noop
+        ),
+        migrations.RunPython(set_updated_at, migrations.RunPython.noop),
+    ]
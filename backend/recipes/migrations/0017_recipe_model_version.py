@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def create_recipe_version(apps, schema_editor):
+    ModelVersion = apps.get_model('recipes', 'ModelVersion')
+    ModelVersion.objects.get_or_create(label='recipes.recipe')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_model_versions_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_recipe_version, migrations.RunPython.noop
+        ),
+    ]
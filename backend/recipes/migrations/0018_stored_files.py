@@ -0,0 +1,60 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:50
+
+from collections import Counter
+
+import recipes.storage
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('recipes', 'User')
+    StoredFile = apps.get_model('recipes', 'StoredFile')
+    references = Counter(
+        Recipe.objects.exclude(image='').values_list('image', flat=True)
+    )
+    references.update(
+        User.objects.exclude(avatar='').exclude(
+            avatar__isnull=True
+        ).values_list('avatar', flat=True)
+    )
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name, refcount=refcount)
+         for name, refcount in references.items()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_model_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Добавьте изображение', storage=recipes.storage.ContentAddressedStorage(), upload_to='media/', verbose_name='Изображение'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(default=None, null=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='users/avatars/', verbose_name='Фото профиля'),
+        ),
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='stored_file_refcount_idx')],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
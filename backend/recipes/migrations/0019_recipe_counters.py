@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_relations(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+
+    def counted(model_name):
+        return Coalesce(Subquery(
+            apps.get_model('recipes', model_name).objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                total=Count('pk')
+            ).values('total')
+        ), 0)
+
+    Recipe.objects.update(
+        favorites_count=counted('FavoriteRecipes'),
+        in_carts_count=counted('ShoppingList'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_stored_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-created_at', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.RunPython(count_relations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['vector'], name='recipe_search_vector_idx'
+)
+
+
+def create_search_index(apps, schema_editor):
+    """GIN-индекс и документы в PostgreSQL, таблица FTS5 в SQLite."""
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.add_index(
+            apps.get_model('recipes', 'RecipeSearchDocument'), SEARCH_INDEX
+        )
+        schema_editor.execute("""
+            INSERT INTO recipes_recipesearchdocument (recipe_id, vector)
+            SELECT r.id,
+                setweight(to_tsvector('russian', r.name), 'A')
+                || setweight(to_tsvector('russian', r.text), 'B')
+                || setweight(to_tsvector(
+                    'russian', coalesce(string_agg(i.name, ' '), '')
+                ), 'C')
+            FROM recipes_recipe r
+            LEFT JOIN recipes_recipeingredient ri ON ri.recipe_id = r.id
+            LEFT JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+            GROUP BY r.id
+        """)
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+            'name, text, ingredients, '
+            'tokenize="unicode61 remove_diacritics 2")'
+        )
+        schema_editor.execute("""
+            INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+            SELECT r.id, r.name, r.text, (
+                SELECT group_concat(i.name, ' ')
+                FROM recipes_recipeingredient ri
+                JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+                WHERE ri.recipe_id = r.id
+            )
+            FROM recipes_recipe r
+        """)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.remove_index(
+            apps.get_model('recipes', 'RecipeSearchDocument'), SEARCH_INDEX
+        )
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchDocument',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True, verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ рецепта',
+                'verbose_name_plural': 'Поисковые документы рецептов',
+            },
+        ),
+        # GIN есть только в PostgreSQL: индекс создаётся в RunPython.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AddIndex(
+                model_name='recipesearchdocument', index=SEARCH_INDEX
+            ),
+        ]),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
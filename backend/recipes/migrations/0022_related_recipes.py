@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_feed_entries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Близость')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='relations_changed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Изменение избранного и корзин'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['relations_changed_at'], name='recipe_relations_changed_idx'),
+        ),
+        migrations.AddField(
+            model_name='relatedrecipe',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='relatedrecipe',
+            name='related',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='recipes.recipe', verbose_name='Похожий рецепт'),
+        ),
+        migrations.AddIndex(
+            model_name='relatedrecipe',
+            index=models.Index(fields=['recipe', '-score'], name='related_recipe_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='relatedrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'related'), name='unique_related_recipe'),
+        ),
+    ]
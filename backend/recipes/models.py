@@ -1,6 +1,16 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When, Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
 
 
 AMOUNT_MIN_VALUE = 1
@@ -32,6 +42,7 @@ class User(AbstractUser):
     )
     avatar = models.ImageField(
         upload_to='users/avatars/',
+        storage=ContentAddressedStorage(),
         null=True,
         default=None,
         verbose_name='Фото профиля',
@@ -69,6 +80,45 @@ class Subscriptions(models.Model):
         ]
 
 
+class ModelVersion(models.Model):
+    """
+    Счётчик изменений модели: увеличивается сигналами при сохранении
+    и удалении объектов. Дешёвый источник ETag и Last-Modified.
+    """
+    label = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Модель'
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    class Meta:
+        verbose_name = 'Версия модели'
+        verbose_name_plural = 'Версии моделей'
+
+    def __str__(self):
+        return f'{self.label} {self.version}'
+
+    @classmethod
+    def bump(cls, model):
+        label = model._meta.label_lower
+        if not cls.objects.filter(label=label).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        ):
+            cls.objects.get_or_create(label=label, defaults={'version': 1})
+
+    @classmethod
+    def current(cls, model):
+        return cls.objects.get_or_create(label=model._meta.label_lower)[0]
+
+
 # ---- Модели для рецептов ----
 class Ingredient(models.Model):
     name = models.CharField(
@@ -130,6 +180,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='media/',
+        storage=ContentAddressedStorage(),
         verbose_name='Изображение',
         help_text='Добавьте изображение'
     )
@@ -155,10 +206,60 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    # Денормализованные счётчики: поддерживаются сигналами избранного
+    # и корзины (recipes/signals.py), сверяются rebuild_recipe_counters.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В списках покупок'
+    )
+    # Когда в последний раз менялись избранное и корзины с рецептом:
+    # по нему compute_related_recipes пересчитывает похожие рецепты.
+    relations_changed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Изменение избранного и корзин'
+    )
+    # False - рецепт не разослан в ленты подписчиков (FeedEntry) и
+    # подмешивается в них при чтении.
+    fanned_out = models.BooleanField(
+        default=False,
+        verbose_name='Разослан в ленты подписчиков'
+    )
 
     class Meta:
         ordering = ('created_at', 'name', 'cooking_time',)
         default_related_name = 'recipes'
+        indexes = (
+            models.Index(
+                fields=('-created_at', '-id'),
+                name='recipe_created_at_idx'
+            ),
+            models.Index(
+                fields=('author', '-created_at', '-id'),
+                name='recipe_author_created_at_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-created_at', '-id'),
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=('author', '-created_at', '-id'),
+                condition=models.Q(fanned_out=False),
+                name='recipe_pull_feed_idx'
+            ),
+            models.Index(
+                fields=('relations_changed_at',),
+                name='recipe_relations_changed_idx'
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -166,6 +267,30 @@ class Recipe(models.Model):
         return self.name
 
 
+class RecipeSearchDocument(models.Model):
+    """
+    Поисковый документ рецепта для PostgreSQL: tsvector из названия,
+    описания и продуктов с русской морфологией. Хранится отдельно,
+    чтобы ленты не читали его вместе с рецептами. Поддерживается
+    recipes.search.update_search_index; в SQLite вместо него - FTS5.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name='Рецепт'
+    )
+    vector = SearchVectorField(null=True, verbose_name='Документ')
+
+    class Meta:
+        verbose_name = 'Поисковый документ рецепта'
+        verbose_name_plural = 'Поисковые документы рецептов'
+        indexes = (
+            GinIndex(fields=('vector',), name='recipe_search_vector_idx'),
+        )
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -223,12 +348,338 @@ class UserRecipeRelation(models.Model):
 
 
 class ShoppingList(UserRecipeRelation):
+    # Счётчик на Recipe, который поддерживает эта связь.
+    recipe_counter = 'in_carts_count'
+
     class Meta(UserRecipeRelation.Meta):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списоки покупок'
 
 
 class FavoriteRecipes(UserRecipeRelation):
+    recipe_counter = 'favorites_count'
+
     class Meta(UserRecipeRelation.Meta):
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+
+
+class RelatedRecipe(models.Model):
+    """
+    Похожий рецепт: косинусная близость рецептов по совместному
+    добавлению в избранное и списки покупок. Для каждого рецепта
+    хранятся RELATED_RECIPES_COUNT ближайших соседей; пересчитываются
+    командой compute_related_recipes.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbors',
+        verbose_name='Рецепт'
+    )
+    related = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbor_of',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Близость')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'related'),
+                name='unique_related_recipe'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='related_recipe_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} -> {self.related} {self.score:.3f}'
+
+
+class ShoppingListTotal(models.Model):
+    """
+    Денормализованные итоги списка покупок: сколько каждого продукта
+    нужно пользователю по всем рецептам в корзине. Поддерживается
+    инкрементально при изменении корзины и продуктов рецептов;
+    сверка и пересчёт - командой rebuild_shopping_totals.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Продукт'
+    )
+    total_amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_total'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} {self.total_amount}'
+
+    @classmethod
+    def apply_deltas(cls, user_ids, deltas):
+        """Прибавляет к итогам пользователей {ingredient_id: delta}."""
+        user_ids = list(user_ids)
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic(savepoint=False):
+            # Недостающие строки вставляются с нулём, а параллельная
+            # вставка той же строки не даёт ошибки уникальности; затем
+            # все строки увеличиваются одним UPDATE под блокировкой.
+            cls.objects.bulk_create(
+                (cls(user_id=user_id, ingredient_id=ingredient_id,
+                     total_amount=0)
+                 for user_id in user_ids
+                 for ingredient_id, delta in deltas.items() if delta > 0),
+                ignore_conflicts=True
+            )
+            totals = cls.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=deltas
+            )
+            totals.update(total_amount=F('total_amount') + Case(
+                *(When(ingredient_id=ingredient_id, then=Value(delta))
+                  for ingredient_id, delta in deltas.items()),
+                output_field=models.IntegerField()
+            ))
+            if min(deltas.values()) < 0:
+                totals.filter(total_amount__lte=0).delete()
+
+    @classmethod
+    def add_recipe(cls, user_ids, recipe_id, sign=1):
+        """Добавляет (sign=1) или убирает (sign=-1) продукты рецепта."""
+        cls.apply_deltas(user_ids, {
+            ingredient_id: amount * sign
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'amount')
+        })
+
+    @classmethod
+    def from_carts(cls, user_ids=None):
+        """
+        Итоги по корзинам: {(user_id, ingredient_id): количество};
+        user_ids=None - для всех пользователей.
+        """
+        carts = RecipeIngredient.objects.filter(
+            recipe__shoppinglist__isnull=False
+        ) if user_ids is None else RecipeIngredient.objects.filter(
+            recipe__shoppinglist__author__in=user_ids
+        )
+        return {
+            (row['recipe__shoppinglist__author'], row['ingredient']):
+                row['total_amount']
+            for row in carts.values(
+                'recipe__shoppinglist__author', 'ingredient'
+            ).annotate(total_amount=Sum('amount')).iterator()
+        }
+
+    @classmethod
+    def recompute(cls, user_ids):
+        """Пересчитывает итоги пользователей заново по их корзинам."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic(savepoint=False):
+            cls.objects.filter(user_id__in=user_ids).delete()
+            cls.objects.bulk_create(
+                cls(user_id=user_id, ingredient_id=ingredient_id,
+                    total_amount=total_amount)
+                for (user_id, ingredient_id), total_amount
+                in cls.from_carts(user_ids).items()
+            )
+
+
+class FeedEntry(models.Model):
+    """
+    Входящая лента подписок (fan-out on write): рецепты авторов, на
+    которых подписан пользователь, раскладываются по лентам подписчиков
+    при создании. Рецепты авторов, у которых больше
+    FEED_FANOUT_MAX_FOLLOWERS подписчиков, не рассылаются
+    (Recipe.fanned_out=False) и подмешиваются в ленту при чтении.
+    В ленте хранится не больше FEED_INBOX_LENGTH последних рецептов.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    # Копия Recipe.created_at: лента сортируется и обрезается без JOIN.
+    created_at = models.DateTimeField(verbose_name='Дата создания рецепта')
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-created_at', '-recipe'),
+                name='feed_entry_user_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+    @staticmethod
+    def fanout_followers(author_id):
+        """
+        id подписчиков автора для рассылки или None, если их больше
+        FEED_FANOUT_MAX_FOLLOWERS и ленты собираются при чтении.
+        """
+        limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+        user_ids = list(Subscriptions.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)[:limit + 1])
+        return None if len(user_ids) > limit else user_ids
+
+    @classmethod
+    def deliver(cls, user_ids, recipes):
+        """
+        Раскладывает рецепты [(id, created_at)] по лентам пользователей
+        пачками по FEED_FANOUT_BATCH_SIZE лент и обрезает эти ленты.
+        """
+        user_ids, recipes = list(user_ids), list(recipes)
+        if not user_ids or not recipes:
+            return
+        batch_size = settings.FEED_FANOUT_BATCH_SIZE
+        with transaction.atomic(savepoint=False):
+            for start in range(0, len(user_ids), batch_size):
+                batch = user_ids[start:start + batch_size]
+                cls.objects.bulk_create(
+                    (cls(user_id=user_id, recipe_id=recipe_id,
+                         created_at=created_at)
+                     for user_id in batch
+                     for recipe_id, created_at in recipes),
+                    ignore_conflicts=True
+                )
+                cls.trim(batch)
+
+    @classmethod
+    def trim(cls, user_ids):
+        """Оставляет в лентах FEED_INBOX_LENGTH последних рецептов."""
+        cls.objects.filter(id__in=cls.objects.filter(
+            user_id__in=user_ids
+        ).annotate(position=Window(
+            RowNumber(),
+            partition_by=F('user'),
+            order_by=(F('created_at').desc(), F('recipe').desc())
+        )).filter(
+            position__gt=settings.FEED_INBOX_LENGTH
+        ).values('id')).delete()
+
+    @classmethod
+    def subscribe(cls, user_id, author_id):
+        """Добавляет в ленту последние разосланные рецепты автора."""
+        cls.deliver((user_id,), Recipe.objects.filter(
+            author_id=author_id, fanned_out=True
+        ).order_by('-created_at', '-id').values_list(
+            'id', 'created_at'
+        )[:settings.FEED_INBOX_LENGTH])
+
+
+class StoredFile(models.Model):
+    """
+    Счётчик ссылок на файл хранилища: сколько рецептов и аватаров
+    указывают на него. Поддерживается сигналами при сохранении и
+    удалении; файлы с нулём ссылок удаляет команда gc_media.
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла'
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+        indexes = (
+            models.Index(
+                fields=('refcount', 'updated_at'),
+                name='stored_file_refcount_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+    @classmethod
+    def change(cls, acquired=(), released=()):
+        """
+        Увеличивает счётчики имён из acquired и уменьшает из released
+        (имя может встречаться несколько раз): по запросу на каждое
+        различное число ссылок.
+        """
+        acquired = Counter(name for name in acquired if name)
+        released = Counter(name for name in released if name)
+        if not acquired and not released:
+            return
+        now = timezone.now()
+        with transaction.atomic(savepoint=False):
+            if acquired:
+                cls.objects.bulk_create(
+                    (cls(name=name) for name in acquired),
+                    ignore_conflicts=True, batch_size=1000
+                )
+            for delta, names in group_by_count(acquired).items():
+                cls.objects.filter(name__in=names).update(
+                    refcount=F('refcount') + delta, updated_at=now
+                )
+            for delta, names in group_by_count(released).items():
+                cls.objects.filter(name__in=names, refcount__gt=0).update(
+                    refcount=Greatest(F('refcount') - delta, 0),
+                    updated_at=now
+                )
+
+
+def group_by_count(counter):
+    groups = defaultdict(list)
+    for name, count in counter.items():
+        groups[count].append(name)
+    return groups
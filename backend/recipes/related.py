@@ -0,0 +1,93 @@
+"""
+Похожие рецепты по совместному добавлению в избранное и списки
+покупок. Рецепт - разреженный вектор по парам (пользователь, связь);
+для пачки рецептов считаются строки произведения A·Aᵀ (число общих
+пользователей), нормируются по косинусу на favorites_count +
+in_carts_count и обрезаются до top-N соседей (RelatedRecipe).
+"""
+import heapq
+import math
+from array import array
+from collections import Counter, defaultdict
+from itertools import repeat
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import FavoriteRecipes, Recipe, RelatedRecipe, ShoppingList
+
+
+RELATIONS = (FavoriteRecipes, ShoppingList)
+
+
+def recipe_weights(chunk_size):
+    """
+    Квадраты норм векторов рецептов - сколько раз рецепт добавлен в
+    избранное и корзины, - в массиве с индексом по id рецепта.
+    """
+    weights = array('I')
+    for recipe_id, weight in Recipe.objects.filter(
+        Q(favorites_count__gt=0) | Q(in_carts_count__gt=0)
+    ).order_by('id').values_list(
+        'id', F('favorites_count') + F('in_carts_count')
+    ).iterator(chunk_size=chunk_size):
+        if recipe_id >= len(weights):
+            weights.extend(repeat(0, recipe_id + 1 - len(weights)))
+        weights[recipe_id] = weight
+    return weights
+
+
+def co_occurrences(chunk, max_user_items):
+    """
+    Для каждого рецепта пачки - Counter: похожий рецепт -> число общих
+    пар (пользователь, связь). Пользователи, добавившие больше
+    max_user_items рецептов, не учитываются: они связывают всё со всем.
+    """
+    counts = {recipe_id: Counter() for recipe_id in chunk}
+    for model in RELATIONS:
+        relations = model.objects.filter(recipe_id__in=chunk)
+        users = defaultdict(list)
+        for recipe_id, user_id in relations.values_list(
+            'recipe_id', 'author_id'
+        ):
+            users[recipe_id].append(user_id)
+        items = defaultdict(lambda: array('I'))
+        for user_id, recipe_id in model.objects.filter(
+            author_id__in=relations.values('author_id')
+        ).values_list('author_id', 'recipe_id').iterator():
+            items[user_id].append(recipe_id)
+        for recipe_id, user_ids in users.items():
+            for user_id in user_ids:
+                if len(items[user_id]) <= max_user_items:
+                    counts[recipe_id].update(items[user_id])
+    for recipe_id, recipe_counts in counts.items():
+        recipe_counts.pop(recipe_id, None)
+    return counts
+
+
+def nearest(counts, weights, recipe_id, top, min_support):
+    """top соседей рецепта: [(близость, id похожего рецепта)]."""
+    weight = max(weights[recipe_id] if recipe_id < len(weights) else 0, 1)
+    return heapq.nlargest(top, (
+        (count / math.sqrt(weight * max(
+            weights[related_id] if related_id < len(weights) else 0, 1
+        )), related_id)
+        for related_id, count in counts.items() if count >= min_support
+    ))
+
+
+def update_related(chunk, weights, top, min_support, max_user_items):
+    """Пересчитывает соседей пачки рецептов; возвращает число строк."""
+    counts = co_occurrences(chunk, max_user_items)
+    rows = [
+        RelatedRecipe(recipe_id=recipe_id, related_id=related_id,
+                      score=score)
+        for recipe_id in chunk
+        for score, related_id in nearest(
+            counts[recipe_id], weights, recipe_id, top, min_support
+        )
+    ]
+    with transaction.atomic():
+        RelatedRecipe.objects.filter(recipe_id__in=chunk).delete()
+        RelatedRecipe.objects.bulk_create(rows)
+    return len(rows)
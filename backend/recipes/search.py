@@ -0,0 +1,120 @@
+"""
+Полнотекстовый поиск рецептов по названию, описанию и продуктам.
+PostgreSQL: RecipeSearchDocument.vector (tsvector с весами A/B/C,
+русская морфология, GIN-индекс), ранжирование ts_rank. SQLite: таблица
+FTS5 с поиском по префиксам слов вместо стемминга, ранжирование bm25 -
+для локальной разработки и бенчмарков.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Ingredient, Recipe, RecipeIngredient, RecipeSearchDocument
+
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса bm25 для столбцов FTS5: название, описание, продукты.
+FTS_WEIGHTS = (10.0, 2.0, 4.0)
+BATCH_SIZE = 500
+WORD = re.compile(r'\w+')
+
+TABLES = {
+    'recipe': Recipe._meta.db_table,
+    'recipe_ingredient': RecipeIngredient._meta.db_table,
+    'ingredient': Ingredient._meta.db_table,
+    'document': RecipeSearchDocument._meta.db_table,
+    'fts': FTS_TABLE,
+}
+POSTGRES_UPSERT = """
+    INSERT INTO {document} (recipe_id, vector)
+    SELECT r.id,
+        setweight(to_tsvector('{config}', r.name), 'A')
+        || setweight(to_tsvector('{config}', r.text), 'B')
+        || setweight(to_tsvector(
+            '{config}', coalesce(string_agg(i.name, ' '), '')
+        ), 'C')
+    FROM {recipe} r
+    LEFT JOIN {recipe_ingredient} ri ON ri.recipe_id = r.id
+    LEFT JOIN {ingredient} i ON i.id = ri.ingredient_id
+    WHERE r.id = ANY(%s)
+    GROUP BY r.id
+    ON CONFLICT (recipe_id) DO UPDATE SET vector = EXCLUDED.vector
+""".format(config=SEARCH_CONFIG, **TABLES)
+SQLITE_DELETE = 'DELETE FROM {fts} WHERE rowid IN ({{ids}})'.format(**TABLES)
+SQLITE_INSERT = """
+    INSERT INTO {fts} (rowid, name, text, ingredients)
+    SELECT r.id, r.name, r.text, (
+        SELECT group_concat(i.name, ' ')
+        FROM {recipe_ingredient} ri
+        JOIN {ingredient} i ON i.id = ri.ingredient_id
+        WHERE ri.recipe_id = r.id
+    )
+    FROM {recipe} r
+    WHERE r.id IN ({{ids}})
+""".format(**TABLES)
+
+
+def batches(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        yield recipe_ids[start:start + BATCH_SIZE]
+
+
+def update_search_index(recipe_ids):
+    """Пересчитывает поисковые документы рецептов: запрос на пачку."""
+    with connection.cursor() as cursor:
+        for batch in batches(recipe_ids):
+            if connection.vendor == 'postgresql':
+                cursor.execute(POSTGRES_UPSERT, (batch,))
+                continue
+            ids = ', '.join(['%s'] * len(batch))
+            cursor.execute(SQLITE_DELETE.format(ids=ids), batch)
+            cursor.execute(SQLITE_INSERT.format(ids=ids), batch)
+
+
+def remove_from_search_index(recipe_ids):
+    """В SQLite строки FTS5 не удаляются каскадом вместе с рецептом."""
+    if connection.vendor == 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for batch in batches(recipe_ids):
+            cursor.execute(
+                SQLITE_DELETE.format(ids=', '.join(['%s'] * len(batch))),
+                batch
+            )
+
+
+def search_recipes(recipes, query):
+    """
+    Оставляет рецепты, подходящие под запрос, и сортирует их
+    по релевантности (search_rank), затем по новизне.
+    """
+    words = WORD.findall(query)
+    if not words:
+        return recipes.none()
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            ' '.join(words), config=SEARCH_CONFIG, search_type='websearch'
+        )
+        recipes = recipes.filter(
+            search_document__vector=search_query
+        ).annotate(search_rank=SearchRank(
+            F('search_document__vector'), search_query
+        ))
+    else:
+        match = ' '.join(f'"{word}"*' for word in words)
+        recipes = recipes.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,)
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, '
+            f'{", ".join(map(str, FTS_WEIGHTS))}) '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'AND rowid = {TABLES["recipe"]}.id',
+            (match,), output_field=FloatField()
+        ))
+    return recipes.order_by('-search_rank', '-created_at', '-id')
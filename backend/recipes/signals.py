@@ -0,0 +1,180 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete
+)
+from django.utils import timezone
+
+from .images import schedule_variants
+from .models import (
+    FavoriteRecipes, Ingredient, ModelVersion, Recipe, ShoppingList,
+    ShoppingListTotal, StoredFile, Tag, User
+)
+from .search import remove_from_search_index
+
+
+VERSIONED_MODELS = (Ingredient, Tag, User)
+
+
+def bump_model_version(sender, update_fields=None, **kwargs):
+    # Вход пользователя обновляет только last_login - данные не меняются.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    ModelVersion.bump(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_model_version, sender=model)
+    post_delete.connect(bump_model_version, sender=model)
+
+
+def schedule_recipe_image_variants(sender, instance, **kwargs):
+    schedule_variants(instance.image.name)
+
+
+def schedule_avatar_variants(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'avatar' in update_fields:
+        schedule_variants(instance.avatar.name if instance.avatar else None)
+
+
+post_save.connect(schedule_recipe_image_variants, sender=Recipe)
+post_save.connect(schedule_avatar_variants, sender=User)
+
+
+# Поля с файлами из ContentAddressedStorage, на которые считаются ссылки.
+MEDIA_FIELDS = {Recipe: 'image', User: 'avatar'}
+
+
+def stored_name(instance, field):
+    """Имя файла в поле; None, если поле не загружено (only/defer)."""
+    if field not in instance.__dict__:
+        return None
+    value = instance.__dict__[field]
+    if not value:
+        return ''
+    return value if isinstance(value, str) else value.name or ''
+
+
+def remember_stored_name(sender, instance, **kwargs):
+    instance._stored_name = stored_name(instance, MEDIA_FIELDS[sender])
+
+
+def count_file_references(sender, instance, created, update_fields=None,
+                          **kwargs):
+    field = MEDIA_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    name = stored_name(instance, field)
+    old_name = '' if created else instance._stored_name
+    if name is None or name == old_name:
+        return
+    # Если прежнее имя неизвестно, ссылка не снимается: файл останется,
+    # а счётчик исправит gc_media --rebuild.
+    StoredFile.change(acquired=(name,), released=(old_name,))
+    instance._stored_name = name
+
+
+def release_file_reference(sender, instance, **kwargs):
+    StoredFile.change(released=(
+        instance._stored_name
+        or stored_name(instance, MEDIA_FIELDS[sender]),
+    ))
+
+
+for model in MEDIA_FIELDS:
+    post_init.connect(remember_stored_name, sender=model)
+    post_save.connect(count_file_references, sender=model)
+    post_delete.connect(release_file_reference, sender=model)
+
+
+RELATIONS = (FavoriteRecipes, ShoppingList)
+
+
+def deleted_model(origin):
+    """Модель, с удаления которой (объекта или queryset) начался каскад."""
+    return getattr(origin, 'model', None) or type(origin)
+
+
+def change_recipe_counter(model, recipe_id, delta):
+    counter = model.recipe_counter
+    Recipe.objects.filter(id=recipe_id).update(**{
+        counter: Greatest(F(counter) + delta, 0),
+        'relations_changed_at': timezone.now()
+    })
+
+
+def release_recipe_counters(sender, instance, **kwargs):
+    """
+    Избранное и корзина пользователя удаляются каскадом: уменьшаем
+    счётчики рецептов одним запросом на связь до удаления, а post_delete
+    строк каскада пропускаем.
+    """
+    for model in RELATIONS:
+        counter = model.recipe_counter
+        Recipe.objects.filter(
+            id__in=model.objects.filter(author=instance).values('recipe_id')
+        ).update(**{
+            counter: Greatest(F(counter) - 1, 0),
+            'relations_changed_at': timezone.now()
+        })
+
+
+pre_delete.connect(release_recipe_counters, sender=User)
+
+
+def remember_relation(sender, instance, **kwargs):
+    instance._relation = (instance.author_id, instance.recipe_id)
+
+
+def add_relation(sender, instance, created, **kwargs):
+    """Счётчик рецепта и итоги корзины при добавлении и правке связи."""
+    author_id, recipe_id = instance._relation
+    relation = (instance.author_id, instance.recipe_id)
+    if not created and relation == (author_id, recipe_id):
+        return
+    if not created:
+        change_recipe_counter(sender, recipe_id, -1)
+    change_recipe_counter(sender, instance.recipe_id, 1)
+    if sender is ShoppingList:
+        if not created:
+            ShoppingListTotal.add_recipe((author_id,), recipe_id, sign=-1)
+        ShoppingListTotal.add_recipe(
+            (instance.author_id,), instance.recipe_id
+        )
+    instance._relation = relation
+
+
+def remove_relation(sender, instance, origin=None, **kwargs):
+    # При удалении рецепта или пользователя каскадом счётчики и итоги
+    # уже уменьшены (release_recipe_counters, subtract_recipe_from_carts),
+    # а продукты рецепта к этому моменту могут быть удалены.
+    if deleted_model(origin) in (Recipe, User):
+        return
+    change_recipe_counter(sender, instance.recipe_id, -1)
+    if sender is ShoppingList:
+        ShoppingListTotal.add_recipe(
+            (instance.author_id,), instance.recipe_id, sign=-1
+        )
+
+
+def subtract_recipe_from_carts(sender, instance, **kwargs):
+    ShoppingListTotal.add_recipe(
+        ShoppingList.objects.filter(recipe=instance).values_list(
+            'author_id', flat=True
+        ),
+        instance.pk, sign=-1
+    )
+
+
+for model in RELATIONS:
+    post_init.connect(remember_relation, sender=model)
+    post_save.connect(add_relation, sender=model)
+    post_delete.connect(remove_relation, sender=model)
+pre_delete.connect(subtract_recipe_from_carts, sender=Recipe)
+
+
+def remove_recipe_search_document(sender, instance, **kwargs):
+    remove_from_search_index((instance.pk,))
+
+
+post_delete.connect(remove_recipe_search_document, sender=Recipe)
@@ -0,0 +1,53 @@
+"""
+Хранилище медиафайлов, адресуемое содержимым: имя файла - SHA-256
+содержимого, поэтому одинаковые загрузки хранятся один раз.
+Ссылки на файлы считает модель StoredFile, а файлы без ссылок
+удаляет команда gc_media.
+"""
+import hashlib
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible(path='recipes.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+
+    def __init__(self, **kwargs):
+        # Одинаковое имя - одинаковое содержимое: параллельная запись
+        # того же файла безопасна, суффиксы к имени не добавляются.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def content_hash(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        # Поле загрузки уже посчитало хэш, пока декодировало base64.
+        digest = getattr(content, 'sha256', None) or self.content_hash(
+            content
+        )
+        directory, file_name = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(file_name)[1].lower()
+        return super().save(
+            posixpath.join(directory, digest + extension), content, max_length
+        )
+
+    def _save(self, name, content):
+        # Файл без ссылок может удалять gc_media: его пишем заново.
+        from .models import StoredFile
+        if self.exists(name) and StoredFile.objects.filter(
+            name=name, refcount__gt=0
+        ).exists():
+            return name
+        return super()._save(name, content)